@@ -0,0 +1,3 @@
+"""
+性能与精度基准测试脚本
+"""
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# benchmarks/import_time.py - 导入耗时预算检查：轻量入口模块不得加载 torch / faiss / transformers，且导入耗时不超过预算
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只有在真正构建管道、加载模型或索引时才应导入的依赖
+HEAVY_MODULES = ["torch", "transformers", "faiss", "gradio"]
+
+# 需要快速导入的入口（命令行 --help、HTTP 服务启动前的导入）
+DEFAULT_MODULES = ["pipelines", "handlers.http_server", "src.metrics", "src.logging_utils"]
+
+# 在子进程中导入模块，报告导入耗时与已加载的重依赖
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="导入耗时预算检查（超出预算或加载了重依赖时以非零状态退出）")
+    parser.add_argument("--modules", type=str, default=",".join(DEFAULT_MODULES), help="要检查的模块，逗号分隔")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="单个模块的导入耗时预算（毫秒，取多次运行的最小值）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块导入的次数（每次使用新的解释器）")
+    parser.add_argument("--output", type=str, default=None, help="将结果写入 JSON 文件")
+    return parser.parse_args()
+
+
+def probe(module: str) -> Dict[str, Any]:
+    """在新的解释器中导入 `module`，返回耗时（秒）与加载的重依赖。"""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check(modules: List[str], budget_ms: float, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for module in modules:
+        runs = [probe(module) for _ in range(repeat)]
+        best_ms = min(run["seconds"] for run in runs) * 1000.0
+        heavy = sorted({name for run in runs for name in run["heavy"]})
+        results[module] = {
+            "import_ms": best_ms,
+            "heavy_modules": heavy,
+            "ok": best_ms <= budget_ms and not heavy,
+        }
+    return results
+
+
+def main():
+    args = parse_args()
+    modules = [name.strip() for name in args.modules.split(",") if name.strip()]
+    results = check(modules, args.budget_ms, args.repeat)
+
+    for module, result in results.items():
+        status = "OK  " if result["ok"] else "FAIL"
+        heavy = f"  加载了: {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else ""
+        print(f"{status} {module:<24} {result['import_ms']:8.1f}ms (预算 {args.budget_ms:.0f}ms){heavy}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"budget_ms": args.budget_ms, "modules": results}, f, indent=2)
+    if not all(result["ok"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# benchmarks/run_benchmarks.py - 使用 stub 模型与合成语料的离线基准测试（仅需 CPU），结果写入 JSON
+
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+import numpy as np
+import torch
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import make_corpus, make_text_queries, make_image_queries
+from pipelines.factory import ComponentFactory
+from pipelines.resources import ResourceRegistry
+from pipelines.retrieval_pipeline import RetrievalPipeline
+from src.encoding.text_encoder import encode_texts
+from src.logging_utils import setup_logging
+
+STUB_MODEL_CONFIG = os.path.join(ROOT, "config", "stub_model_config.yaml")
+
+# 基准测试中各索引使用的参数（CPU）
+INDEXER_PARAMS = {
+    "faiss_flat": {},
+    "faiss_lsh": {"nbits": 256},
+    "faiss_ivf": {"nlist": 1024, "nprobe": 16},
+    "faiss_hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "sharded": {"shards": 2, "shard_indexer": {"type": "faiss_flat"}},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多模态检索系统 - 离线基准测试（stub 模型 + 合成语料）")
+    parser.add_argument("--config", type=str, default=os.path.join(ROOT, "config", "pipeline_config.yaml"),
+                        help="基础管道配置，模型与数据路径会被替换为 stub 模型与合成语料")
+    parser.add_argument("--images", type=int, default=500, help="合成图像数量")
+    parser.add_argument("--texts", type=int, default=5000, help="合成文本数量")
+    parser.add_argument("--queries", type=int, default=200, help="每项测试的查询数量")
+    parser.add_argument("--k", type=int, default=10, help="检索的 top-k")
+    parser.add_argument("--indexers", type=str, default="faiss_flat,faiss_lsh,faiss_ivf,faiss_hnsw",
+                        help=f"参与测试的索引，逗号分隔，可选: {','.join(INDEXER_PARAMS)}")
+    parser.add_argument("--pipeline-indexer", type=str, default="faiss_flat", help="端到端测试使用的索引")
+    parser.add_argument("--preprocessor", type=str, default="standard", help="预处理器类型（standard / streaming）")
+    parser.add_argument("--query-cache", action="store_true", help="端到端测试时启用查询向量缓存")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=str, default=None, help="语料与缓存目录（默认使用临时目录，结束后删除）")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="结果 JSON 文件路径")
+    return parser.parse_args()
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """秒为单位的耗时样本 -> 毫秒分位数。"""
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """临时将日志级别提高到 WARNING，屏蔽管道的逐条日志，避免格式化开销与刷屏。"""
+    root = logging.getLogger()
+    level = root.level
+    root.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        root.setLevel(level)
+
+
+def indexer_config(name: str, dim: int) -> Dict[str, Any]:
+    if name not in INDEXER_PARAMS:
+        raise ValueError(f"Unknown indexer '{name}', expected one of {list(INDEXER_PARAMS)}")
+    return {"type": name, "params": dict(INDEXER_PARAMS[name], dim=dim, use_gpu=False)}
+
+
+def environment() -> Dict[str, Any]:
+    import faiss
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+    }
+
+
+def bench_ingestion(base_config, data_config, cache_dir, preprocessor_type, model, dim) -> Dict[str, Any]:
+    """冷启动（全部编码）与热启动（命中缓存）的预处理耗时。"""
+    params = dict(base_config["preprocessor"]["params"], cache_dir=cache_dir)
+    preprocessor = ComponentFactory.create_component("preprocessor", {"type": preprocessor_type, "params": params})
+    indexer = ComponentFactory.create_component("indexer", indexer_config("faiss_flat", dim))
+
+    start = time.perf_counter()
+    with quiet():
+        data = preprocessor.process_data(data_config, model.model, model.tokenizer, indexer)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet():
+        preprocessor.process_data(data_config, model.model, model.tokenizer, indexer)
+    warm = time.perf_counter() - start
+
+    items = len(data["image_paths"]) + len(data["text_ids"])
+    return {
+        "preprocessor": preprocessor_type,
+        "feature_dtype": params.get("feature_dtype"),
+        "images": len(data["image_paths"]),
+        "texts": len(data["text_ids"]),
+        "cold_seconds": cold,
+        "cold_items_per_second": items / cold,
+        "warm_seconds": warm,
+    }, data
+
+
+def bench_indexers(names: List[str], features, queries: np.ndarray, k: int) -> Dict[str, Any]:
+    """各索引的构建耗时、单查询延迟分位数、批量吞吐与相对精确检索的 recall@k。"""
+    features_np = np.ascontiguousarray(np.asarray(features), dtype=np.float32)
+    dim = features_np.shape[1]
+    exact = ComponentFactory.create_component("indexer", indexer_config("faiss_flat", dim))
+    _, truth = exact.create_index(features_np).search(queries, k)
+
+    results = {}
+    for name in names:
+        indexer = ComponentFactory.create_component("indexer", indexer_config(name, dim))
+        start = time.perf_counter()
+        with quiet():
+            index = indexer.create_index(features_np)
+        build = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        _, ids = index.search(queries, k)
+        batch = time.perf_counter() - start
+
+        recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(ids, truth)])
+        results[name] = {
+            "params": INDEXER_PARAMS[name],
+            "vectors": len(features_np),
+            "build_seconds": build,
+            "search": latency_summary(latencies),
+            "batch_queries_per_second": len(queries) / batch,
+            f"recall_at_{k}": float(recall),
+        }
+        if hasattr(index, "close"):
+            index.close()
+        print(f"  {name:<12} build {build:8.2f}s  p50 {results[name]['search']['p50_ms']:7.3f}ms  "
+              f"p99 {results[name]['search']['p99_ms']:7.3f}ms  recall@{k} {recall:.4f}")
+    return results
+
+
+def bench_pipeline(base_config, data_config, cache_dir, args, dim, text_queries, image_queries) -> Dict[str, Any]:
+    """RetrievalPipeline.run 在各查询类型下的端到端延迟，以及 run_batch 的吞吐。"""
+    config = copy.deepcopy(base_config)
+    config["model_config_path"] = STUB_MODEL_CONFIG
+    config["data"] = data_config
+    config["preprocessor"] = {"type": args.preprocessor, "params": dict(config["preprocessor"]["params"], cache_dir=cache_dir)}
+    config["indexer"] = indexer_config(args.pipeline_indexer, dim)
+    config["top_k"] = args.k
+    config.setdefault("query_cache", {})["enabled"] = args.query_cache
+
+    start = time.perf_counter()
+    with quiet():
+        pipeline = RetrievalPipeline(config)
+    startup = time.perf_counter() - start
+
+    inputs = {
+        "text2image": [{"query_type": "text2image", "text": text} for text in text_queries],
+        "text2text": [{"query_type": "text2text", "text": text} for text in text_queries],
+        "image2text": [{"query_type": "image2text", "image": image} for image in image_queries],
+        "multimodal2text": [
+            {"query_type": "multimodal2text", "image": image, "text": text}
+            for image, text in zip(image_queries, text_queries)
+        ],
+    }
+
+    results = {"indexer": args.pipeline_indexer, "query_cache": args.query_cache, "startup_seconds": startup, "query_types": {}}
+    for query_type, queries in inputs.items():
+        with quiet():
+            # 预热
+            for input_data in queries[:5]:
+                pipeline.run(input_data)
+            latencies = []
+            for input_data in queries:
+                start = time.perf_counter()
+                pipeline.run(input_data)
+                latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            pipeline.run_batch(queries)
+            batch = time.perf_counter() - start
+
+        results["query_types"][query_type] = {
+            "run": latency_summary(latencies),
+            "run_batch_queries_per_second": len(queries) / batch,
+        }
+        summary = results["query_types"][query_type]["run"]
+        print(f"  {query_type:<16} p50 {summary['p50_ms']:8.2f}ms  p95 {summary['p95_ms']:8.2f}ms  "
+              f"p99 {summary['p99_ms']:8.2f}ms")
+    return results
+
+
+def main():
+    args = parse_args()
+    setup_logging()
+    with open(args.config, "r") as f:
+        base_config = yaml.safe_load(f)
+    with open(STUB_MODEL_CONFIG, "r") as f:
+        dim = yaml.safe_load(f)["model"].get("dim", 512)
+    indexers = [name.strip() for name in args.indexers.split(",") if name.strip()]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mmr_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        print(f"生成合成语料: {args.images} 张图像, {args.texts} 条文本 -> {workdir}")
+        data_config = make_corpus(os.path.join(workdir, "corpus"), args.images, args.texts, seed=args.seed)
+        text_queries = make_text_queries(data_config["text_jsonl"], args.queries, seed=args.seed)
+        image_queries = make_image_queries(data_config["image_folder"], args.queries, seed=args.seed)
+        cache_dir = os.path.join(workdir, "cache")
+        model = ResourceRegistry.get_model(STUB_MODEL_CONFIG)
+
+        print("预处理（编码 + 缓存）...")
+        ingestion, data = bench_ingestion(base_config, data_config, cache_dir, args.preprocessor, model, dim)
+        print(f"  冷启动 {ingestion['cold_seconds']:.2f}s ({ingestion['cold_items_per_second']:.1f} items/s), "
+              f"热启动 {ingestion['warm_seconds']:.2f}s")
+
+        print(f"索引构建与检索（{len(data['text_ids'])} 个文本向量）...")
+        query_features = encode_texts(
+            model.model, model.tokenizer, text_queries,
+            base_config["max_token_length"], base_config["stride"]
+        ).numpy().astype(np.float32)
+        indexer_results = bench_indexers(indexers, data["text_features"], query_features, args.k)
+
+        print(f"端到端 RetrievalPipeline.run（{args.pipeline_indexer}）...")
+        pipeline_results = bench_pipeline(base_config, data_config, cache_dir, args, dim, text_queries, image_queries)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "environment": environment(),
+        "settings": {key: value for key, value in vars(args).items() if key != "workdir"},
+        "ingestion": ingestion,
+        "indexers": indexer_results,
+        "pipeline": pipeline_results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
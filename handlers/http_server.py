@@ -0,0 +1,363 @@
+# handlers/http_server.py
+import asyncio
+import base64
+import binascii
+import io
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from PIL import Image, UnidentifiedImageError
+
+from pipelines import PipelineRegistry, MicroBatchScheduler
+from src.deadline import Deadline
+from src.logging_utils import bind_request_id, new_request_id
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = metrics.REGISTRY.counter(
+    "mmr_http_requests_total", "HTTP requests by path and status code",
+    ["path", "status"]
+)
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "mmr_http_request_seconds", "HTTP request latency by path, including queueing",
+    ["path"]
+)
+# Client-supplied X-Request-Id values are echoed back and logged, so keep them short and printable
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+class HTTPError(Exception):
+    """Error that is reported to the client with the given status code."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class PipelineHTTPServer:
+    """Headless JSON-over-HTTP server for the retrieval and query-analysis pipelines.
+
+    An asyncio loop accepts connections and parses requests. Retrieval requests are
+    queued directly on the micro-batch scheduler when it is enabled; other model and
+    index work runs on a bounded thread pool. At most `max_pending` requests are admitted at once, so
+    overload is answered with 503 instead of an unbounded queue. Pipelines are loaded
+    in the background: /healthz answers as soon as the loop runs, /readyz once every
+    pipeline is loaded.
+
+    Endpoints:
+        GET  /healthz, /readyz
+        GET  /metrics                        Prometheus text format
+        POST /v1/text2image, /v1/text2text   {"text": ...}
+        POST /v1/image2text                  {"image": <base64>}
+        POST /v1/multimodal2text             {"image": <base64>, "text": ...}
+        POST /v1/analyze                     {"image": <base64>, "text": ...}
+    Every POST body may also set "deadline_ms". A request's X-Request-Id header (or a
+    generated id) tags its log records and is returned in the response headers.
+    """
+
+    METRIC_PATHS = {"/healthz", "/readyz", "/metrics", "/v1/text2image", "/v1/text2text",
+                    "/v1/image2text", "/v1/multimodal2text", "/v1/analyze"}
+
+    QUERY_FIELDS = {
+        "text2image": ("text",),
+        "text2text": ("text",),
+        "image2text": ("image",),
+        "multimodal2text": ("image", "text"),
+    }
+
+    def __init__(self, retrieval_config: Dict[str, Any], query_analysis_config: Optional[Dict[str, Any]] = None,
+                 server_config: Optional[Dict[str, Any]] = None):
+        server_config = server_config or {}
+        self.retrieval_config = retrieval_config
+        self.query_analysis_config = query_analysis_config
+        self.host = server_config.get("host", "0.0.0.0")
+        self.port = server_config.get("port", 8080)
+        self.workers = server_config.get("workers", 4)
+        self.max_pending = server_config.get("max_pending", 64)
+        self.request_timeout = server_config.get("request_timeout_s", 30)
+        self.max_body_bytes = server_config.get("max_body_mb", 16) * 1024 * 1024
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http-worker")
+        self.retrieval_pipeline = None
+        self.query_analysis_pipeline = None
+        self.scheduler = None
+        self.load_error: Optional[str] = None
+        self._ready = threading.Event()
+        self._pending = 0
+        self._server = None
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def load_pipelines(self):
+        """Build the pipelines (blocking); called on a worker thread at startup."""
+        try:
+            self.retrieval_pipeline = PipelineRegistry.get_pipeline("retrieval", self.retrieval_config)
+            scheduler_config = self.retrieval_config.get("scheduler", {})
+            if scheduler_config.get("enabled", False):
+                self.scheduler = MicroBatchScheduler(self.retrieval_pipeline, scheduler_config)
+            if self.query_analysis_config is not None:
+                self.query_analysis_pipeline = PipelineRegistry.get_pipeline("query_analysis", self.query_analysis_config)
+            self._ready.set()
+            logger.info("HTTP server pipelines ready")
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            logger.exception("Failed to load pipelines: %s", self.load_error)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self.executor, self.load_pipelines)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sockets = self._server.sockets or []
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info("HTTP server listening on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------ HTTP protocol
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                request_id = headers.get("x-request-id", "")
+                if not REQUEST_ID_PATTERN.match(request_id):
+                    request_id = new_request_id()
+
+                start = time.perf_counter()
+                status, payload = await self._dispatch(method, path, body, request_id)
+                elapsed = time.perf_counter() - start
+                metric_path = path if path in self.METRIC_PATHS else "other"
+                HTTP_REQUESTS.inc(path=metric_path, status=int(status))
+                HTTP_REQUEST_SECONDS.observe(elapsed, path=metric_path)
+                logger.debug("%s %s -> %d in %.1fms", method, path, status, elapsed * 1000,
+                             extra={"request_id": request_id})
+                await self._write_response(writer, status, payload, keep_alive, request_id)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_body_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body exceeds {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: int, payload: Union[Dict[str, Any], str],
+                              keep_alive: bool, request_id: Optional[str] = None):
+        if isinstance(payload, str):
+            # Plain-text payloads are metric expositions
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        status = HTTPStatus(status)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if request_id:
+            head += f"X-Request-Id: {request_id}\r\n"
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    # ------------------------------------------------------------------ routing
+
+    async def _dispatch(self, method: str, path: str, body: bytes,
+                        request_id: str) -> Tuple[int, Union[Dict[str, Any], str]]:
+        if path == "/healthz":
+            return HTTPStatus.OK, {"status": "alive"}
+        if path == "/metrics":
+            return HTTPStatus.OK, metrics.render()
+        if path == "/readyz":
+            if self.ready:
+                return HTTPStatus.OK, {"status": "ready"}
+            if self.load_error:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {"status": "failed", "error": self.load_error}
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"status": "loading"}
+
+        if not path.startswith("/v1/"):
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST"}
+        if not self.ready:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Pipelines are not ready"}
+
+        endpoint = path[len("/v1/"):]
+        if endpoint in self.QUERY_FIELDS:
+            handler = self._handle_retrieval
+        elif endpoint == "analyze":
+            if self.query_analysis_pipeline is None:
+                return HTTPStatus.NOT_FOUND, {"error": "Query analysis is not enabled on this server"}
+            handler = self._handle_analysis
+        else:
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {endpoint}"}
+
+        # Admission control: shed load instead of queueing without bound
+        if self._pending >= self.max_pending:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Server busy"}
+        self._pending += 1
+        job = None
+        try:
+            request = self._parse_body(endpoint, body)
+            start = time.perf_counter()
+            if handler == self._handle_retrieval and self.scheduler is not None:
+                # Queue straight into the micro-batcher; blocking a worker thread per request
+                # would cap every batch at `workers` requests
+                job = self.scheduler.submit(dict(request, query_type=endpoint, request_id=request_id))
+            else:
+                job = self.executor.submit(bind_request_id(handler, request_id), endpoint, request)
+            # The slot is released when the work finishes (or is cancelled before it starts),
+            # not when a timed-out client is answered, so admission keeps bounding real work
+            loop = asyncio.get_running_loop()
+            job.add_done_callback(lambda _: self._release_soon(loop))
+            result = await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.request_timeout)
+            response = self._retrieval_response(request, result) if handler == self._handle_retrieval else result
+            response["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return HTTPStatus.OK, response
+        except HTTPError as e:
+            return e.status, {"error": e.message}
+        except asyncio.TimeoutError:
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": f"Request exceeded {self.request_timeout}s"}
+        except Exception as e:
+            logger.exception("Request to %s failed", path, extra={"request_id": request_id})
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            if job is None:
+                self._pending -= 1
+
+    def _release_soon(self, loop: asyncio.AbstractEventLoop):
+        """Free an admission slot from whichever thread finished the request."""
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The loop is already closed during shutdown
+            pass
+
+    def _release(self):
+        self._pending -= 1
+
+    def _parse_body(self, endpoint: str, body: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+
+        fields = self.QUERY_FIELDS.get(endpoint, ("image", "text"))
+        parsed = {}
+        for field in fields:
+            value = request.get(field)
+            if not isinstance(value, str) or not value.strip():
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing '{field}'")
+            parsed[field] = self._decode_image(value) if field == "image" else value
+
+        deadline_ms = request.get("deadline_ms")
+        if deadline_ms is not None:
+            if not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "'deadline_ms' must be a positive number")
+            parsed["deadline"] = Deadline(float(deadline_ms))
+        return parsed
+
+    @staticmethod
+    def _decode_image(value: str) -> Image.Image:
+        """Decode a base64 image, optionally given as a data URL."""
+        if value.startswith("data:"):
+            value = value.split(",", 1)[-1]
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(value, validate=True)))
+            return image.convert("RGB")
+        except (binascii.Error, ValueError, UnidentifiedImageError, OSError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'image' must be a base64-encoded image")
+
+    # ------------------------------------------------------------------ handlers (worker threads)
+
+    def _handle_retrieval(self, query_type: str, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Only used without a scheduler; otherwise requests are submitted to it directly
+        return self.retrieval_pipeline.run(dict(request, query_type=query_type))
+
+    @staticmethod
+    def _retrieval_response(request: Dict[str, Any], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        deadline = request.get("deadline")
+        return {"results": results, "degradations": deadline.degradations if deadline else []}
+
+    def _handle_analysis(self, endpoint: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        output = self.query_analysis_pipeline.run(dict(request, query_type="multimodal2text"))
+        # The raw generation and tracebacks are for local debugging, not API clients
+        analysis = output.get("query_analysis") or {}
+        output["query_analysis"] = {key: analysis[key] for key in ("success", "error", "cached") if key in analysis}
+        output.pop("stage", None)
+        return output
+
+
+def run_server(retrieval_config: Dict[str, Any], query_analysis_config: Optional[Dict[str, Any]] = None,
+               server_config: Optional[Dict[str, Any]] = None):
+    """Run the HTTP server until interrupted."""
+    server = PipelineHTTPServer(retrieval_config, query_analysis_config, server_config)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Shutting down HTTP server")
+    finally:
+        server.close()
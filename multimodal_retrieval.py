@@ -4,9 +4,11 @@
 import os
 import gradio as gr
 import yaml
-from pipelines import PipelineRegistry
+from pipelines import PipelineRegistry, MicroBatchScheduler
+from src.logging_utils import setup_logging
 
 def main():
+    setup_logging()
     # 确保配置文件路径正确
     retrieval_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
                               "config/pipeline_config.yaml")
@@ -24,6 +26,14 @@ def main():
     # 从注册表创建检索pipeline
     retrieval_pipeline = PipelineRegistry.get_pipeline("retrieval", retrieval_config)
     query_analysis_pipeline = PipelineRegistry.get_pipeline("query_analysis", query_analysis_config)
+
+    # 并发请求合并为批量编码与检索
+    scheduler_config = retrieval_config.get("scheduler", {})
+    if scheduler_config.get("enabled", False):
+        scheduler = MicroBatchScheduler(retrieval_pipeline, scheduler_config)
+        retrieve = scheduler.run
+    else:
+        retrieve = retrieval_pipeline.run
     
     # Gradio UI
     with gr.Blocks(title="BGE-VL Multimodal Retrieval System") as demo:
@@ -38,7 +48,7 @@ def main():
                 def text2image_search(query):
                     if not query or query.strip() == "":
                         return []
-                    results = retrieval_pipeline.run({"query_type": "text2image", "text": query})
+                    results = retrieve({"query_type": "text2image", "text": query})
                     return [item["path"] for item in results]
                 
                 btn.click(fn=text2image_search, inputs=txt, outputs=gallery)
@@ -52,7 +62,7 @@ def main():
                     if not query or query.strip() == "":
                         return "请输入查询文本。"
                     
-                    results = retrieval_pipeline.run({"query_type": "text2text", "text": query})
+                    results = retrieve({"query_type": "text2text", "text": query})
                     if not results:
                         return "未找到匹配的文本。"
                     return "\n\n".join([f"**[{item['id']}]**  \n{item['content']}" for item in results])
@@ -68,7 +78,7 @@ def main():
                     if image is None:
                         return "请上传图像。"
                     
-                    results = retrieval_pipeline.run({"query_type": "image2text", "image": image})
+                    results = retrieve({"query_type": "image2text", "image": image})
                     if not results:
                         return "未找到匹配的文本。"
                     return "\n\n".join([f"**[{item['id']}]**  \n{item['content']}" for item in results])
@@ -88,51 +98,59 @@ def main():
                 
                 out_text2 = gr.Markdown(label="匹配的文本")
                 
+                def format_text_results(retrieval_results):
+                    if not retrieval_results:
+                        return "未找到匹配的文本。"
+                    return "\n\n".join([f"**[{item['id']}]**  \n{item['content']}" for item in retrieval_results])
+
                 def multimodal2text_search(image, text, use_query_analysis):
+                    # 生成器：启用查询分析时先返回基线检索结果，分析完成后再更新为增强检索结果
                     if image is None:
-                        return "请上传图像。", "未进行查询分析"
+                        yield "请上传图像。", "未进行查询分析"
+                        return
                     if not text or text.strip() == "":
-                        return "请输入查询文本。", "未进行查询分析"
+                        yield "请输入查询文本。", "未进行查询分析"
+                        return
                     
                     if use_query_analysis:
-                        # 使用查询分析管道
-                        results = query_analysis_pipeline.run({
+                        # 使用查询分析管道（基线检索与查询分析并行执行）
+                        for results in query_analysis_pipeline.run_stream({
                             "query_type": "multimodal2text", 
                             "image": image, 
                             "text": text
-                        })
-                        
-                        # 提取分析信息
-                        analysis_markdown = ""
-                        if results.get("enhanced_query"):
-                            analysis_markdown += f"**原始查询**: {results['original_query']}\n\n"
-                            analysis_markdown += f"**增强查询**: {results['enhanced_query']}\n\n"
-                            analysis_markdown += "**关键词**:\n"
-                            analysis_markdown += f"- 显式关键词: {', '.join(results['keywords']['explicit'])}\n"
-                            analysis_markdown += f"- 隐式关键词: {', '.join(results['keywords']['implicit'])}\n"
-                        else:
-                            analysis_markdown = "查询分析失败，使用原始查询。"
-                        
-                        # 返回检索结果和分析信息
-                        retrieval_results = results["results"]
-                        if not retrieval_results:
-                            return "未找到匹配的文本。", analysis_markdown
-                        return "\n\n".join([f"**[{item['id']}]**  \n{item['content']}" for item in retrieval_results]), analysis_markdown
+                        }):
+                            if results.get("stage") == "baseline":
+                                yield format_text_results(results["results"]), "查询分析进行中，当前为原始查询的检索结果…"
+                                continue
+
+                            # 提取分析信息
+                            analysis_markdown = ""
+                            if results.get("enhanced_query"):
+                                analysis_markdown += f"**原始查询**: {results['original_query']}\n\n"
+                                analysis_markdown += f"**增强查询**: {results['enhanced_query']}\n\n"
+                                analysis_markdown += "**关键词**:\n"
+                                analysis_markdown += f"- 显式关键词: {', '.join(results['keywords']['explicit'])}\n"
+                                analysis_markdown += f"- 隐式关键词: {', '.join(results['keywords']['implicit'])}\n"
+                            else:
+                                analysis_markdown = "查询分析失败，使用原始查询。"
+                            
+                            # 返回检索结果和分析信息
+                            yield format_text_results(results["results"]), analysis_markdown
                     else:
                         # 使用标准检索管道
-                        results = retrieval_pipeline.run({
+                        results = retrieve({
                             "query_type": "multimodal2text", 
                             "image": image, 
                             "text": text
                         })
-                        if not results:
-                            return "未找到匹配的文本。", "未使用查询分析"
-                        return "\n\n".join([f"**[{item['id']}]**  \n{item['content']}" for item in results]), "未使用查询分析"
+                        yield format_text_results(results), "未使用查询分析"
                 
                 btn3.click(fn=multimodal2text_search, inputs=[img2, txt2, use_analysis], outputs=[out_text2, analysis_info])
 
     # 启动Gradio界面
     print("Starting Gradio interface...")
+    # 允许多个请求同时进入处理函数，以便调度器合并批次
+    demo.queue(default_concurrency_limit=scheduler_config.get("concurrency", 1))
     demo.launch(share=False)
 
 if __name__ == '__main__':
@@ -1,21 +1,43 @@
 """
 多模态检索系统管道模块
+
+管道类在首次使用时才导入（torch / faiss / transformers 随之加载），
+因此 `import pipelines` 与命令行 --help 不需要加载这些依赖。
 """
 
+import importlib
+
 from .base_pipeline import BasePipeline
 from .registry import PipelineRegistry
 from .factory import ComponentFactory
-from .retrieval_pipeline import RetrievalPipeline
-from .query_analysis_pipeline import QueryAnalysisPipeline
+from .resources import ResourceRegistry
+from .scheduler import MicroBatchScheduler
+
+# 按需导入的管道类
+_LAZY_PIPELINES = {
+    "RetrievalPipeline": ".retrieval_pipeline",
+    "QueryAnalysisPipeline": ".query_analysis_pipeline",
+}
 
 # 注册所有可用的管道
-PipelineRegistry.register("retrieval")(RetrievalPipeline)
-PipelineRegistry.register("query_analysis")(QueryAnalysisPipeline)
+PipelineRegistry.register_lazy("retrieval", "pipelines.retrieval_pipeline:RetrievalPipeline")
+PipelineRegistry.register_lazy("query_analysis", "pipelines.query_analysis_pipeline:QueryAnalysisPipeline")
+
+
+def __getattr__(name):
+    if name in _LAZY_PIPELINES:
+        value = getattr(importlib.import_module(_LAZY_PIPELINES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "BasePipeline",
     "PipelineRegistry",
     "ComponentFactory",
+    "ResourceRegistry",
     "RetrievalPipeline",
     "QueryAnalysisPipeline",
+    "MicroBatchScheduler",
 ]
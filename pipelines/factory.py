@@ -1,34 +1,45 @@
-from typing import Dict, Any, Type
-from src.data_preprocessing.preprocessor import Preprocessor
-from src.encoding.joint_encoder import JointEncoder
-from src.indexing.faiss_lsh import FaissLSH
-from src.retrieval.retriever import Retriever
+import importlib
+import logging
+from typing import Dict, Any, Type, Union
+from .resources import ResourceRegistry
+
+logger = logging.getLogger(__name__)
 
 class ComponentFactory:
     """Factory for creating pipeline components."""
     
-    _component_registry: Dict[str, Dict[str, Type]] = {
+    # Components are registered as "module:Class" paths and imported on first use, so that
+    # importing the factory does not pull in torch, faiss or transformers
+    _component_registry: Dict[str, Dict[str, Union[Type, str]]] = {
         "preprocessor": {
-            "standard": Preprocessor
+            "standard": "src.data_preprocessing.preprocessor:Preprocessor",
+            "streaming": "src.data_preprocessing.streaming_preprocessor:StreamingPreprocessor"
         },
         "encoder": {
-            "joint": JointEncoder
+            "joint": "src.encoding.joint_encoder:JointEncoder"
         },
         "indexer": {
-            "faiss_lsh": FaissLSH
+            "faiss_lsh": "src.indexing.faiss_lsh:FaissLSH",
+            "faiss_flat": "src.indexing.faiss_flat:FaissFlatIP",
+            "faiss_ivf": "src.indexing.faiss_ivf:FaissIVF",
+            "faiss_hnsw": "src.indexing.faiss_hnsw:FaissHNSW",
+            "sharded": "src.indexing.sharded:ShardedIndexer"
         },
         "retriever": {
-            "standard": Retriever
+            "standard": "src.retrieval.retriever:Retriever"
+        },
+        "reranker": {
+            "exact": "src.retrieval.reranker:ExactReranker"
         }
     }
     
     @classmethod
-    def register_component(cls, component_type: str, name: str, component_class: Type):
-        """Register a new component."""
+    def register_component(cls, component_type: str, name: str, component_class: Union[Type, str]):
+        """Register a new component class, or its "module:Class" path to import it on first use."""
         if component_type not in cls._component_registry:
             cls._component_registry[component_type] = {}
         
-        print(f"Registering component: {component_type}.{name}")
+        logger.debug("Registering component: %s.%s", component_type, name)
         cls._component_registry[component_type][name] = component_class
     
     @classmethod
@@ -36,6 +47,16 @@ class ComponentFactory:
         """Get the current component registry."""
         return cls._component_registry
     
+    @classmethod
+    def get_class(cls, component_type: str, name: str) -> Type:
+        """Class of a registered component, importing it if it was registered by path."""
+        component_class = cls._component_registry[component_type][name]
+        if isinstance(component_class, str):
+            module_name, class_name = component_class.split(":")
+            component_class = getattr(importlib.import_module(module_name), class_name)
+            cls._component_registry[component_type][name] = component_class
+        return component_class
+    
     @classmethod
     def create_component(cls, component_type: str, config: Dict[str, Any]):
         """Create a component instance based on type and configuration."""
@@ -47,10 +68,16 @@ class ComponentFactory:
             available = list(cls._component_registry[component_type].keys())
             raise ValueError(f"Component '{component_name}' not found in {component_type} registry. Available components: {available}")
         
-        print(f"Creating component: {component_type}.{component_name}")
-        component_class = cls._component_registry[component_type][component_name]
+        logger.info("Creating component: %s.%s", component_type, component_name)
+        component_class = cls.get_class(component_type, component_name)
         try:
             return component_class(config["params"])
         except Exception as e:
-            print(f"Error creating component {component_type}.{component_name}: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error("Error creating component %s.%s: %s", component_type, component_name, e)
+            raise
+
+    @classmethod
+    def get_shared_component(cls, component_type: str, config: Dict[str, Any]):
+        """Return a process-wide instance for this exact configuration, creating it once."""
+        key = ResourceRegistry.make_key(f"component.{component_type}", config)
+        return ResourceRegistry.get_or_create(key, lambda: cls.create_component(component_type, config))
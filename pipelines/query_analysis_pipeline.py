@@ -1,4 +1,6 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError, wait
+import logging
 import torch
 import numpy as np
 from PIL import Image
@@ -11,6 +13,13 @@ from src.encoding.image_encoder import encode_image
 from src.encoding.text_encoder import encode_text
 from src.encoding.joint_encoder import encode_image_text
 from src.query_analysis.query_analyzer import QueryAnalyzer
+from src.query_analysis.stub_analyzer import StubQueryAnalyzer
+from src.query_analysis.analysis_cache import AnalysisCache
+from src.deadline import Deadline, tightest
+from src.logging_utils import bind_request_id, get_request_id, new_request_id, request_context
+from src import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class QueryAnalysisPipeline(BasePipeline):
@@ -18,23 +27,39 @@ class QueryAnalysisPipeline(BasePipeline):
     
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
+        if "metrics" in self.config:
+            metrics.configure(self.config["metrics"])
         self.retrieval_pipeline = self._initialize_retrieval_pipeline()
-        print("🚀 QueryAnalysisPipeline initialized successfully!")
+        self.deadline_config = self.config.get("deadline", {})
+        # 用于并行执行查询分析与基线检索
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.get("speculative_workers", 4),
+            thread_name_prefix="query-analysis"
+        )
+        logger.info("🚀 QueryAnalysisPipeline initialized successfully!")
 
     def _initialize_components(self) -> Dict[str, Any]:
         """初始化查询分析组件"""
         components = {}
         
-        print("⚙️ Initializing query analysis components...")
+        logger.info("⚙️ Initializing query analysis components...")
         
         # 初始化查询分析器
-        components["query_analyzer"] = QueryAnalyzer(self.config.get("query_analyzer", {}))
+        analyzer_config = self.config.get("query_analyzer", {})
+        if analyzer_config.get("model_path") == "stub":
+            components["query_analyzer"] = StubQueryAnalyzer(analyzer_config)
+        else:
+            components["query_analyzer"] = QueryAnalyzer(analyzer_config)
+
+        # 初始化查询分析结果缓存
+        if self.config.get("analysis_cache", {}).get("enabled", False):
+            components["analysis_cache"] = AnalysisCache(self.config["analysis_cache"])
         
         return components
     
     def _initialize_retrieval_pipeline(self) -> RetrievalPipeline:
         """初始化检索管道"""
-        print("⚙️ Initializing retrieval pipeline...")
+        logger.info("⚙️ Initializing retrieval pipeline...")
         from .registry import PipelineRegistry
         
         # 使用相同的配置初始化检索管道
@@ -45,52 +70,187 @@ class QueryAnalysisPipeline(BasePipeline):
         return PipelineRegistry.get_pipeline("retrieval", retrieval_config)
     
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """执行查询分析管道"""
+        """执行查询分析管道
+
+        请求可带 deadline_ms（或 Deadline 对象 deadline），各阶段按剩余时间降级，
+        所做的降级记录在结果的 degradations 中。
+        """
         query_type = input_data.get("query_type", "multimodal2text")
-        print(f"🔍 Running query analysis pipeline with mode: {query_type}")
-        
-        # 只对图文共查模式应用查询分析
-        if query_type == "multimodal2text" and "image" in input_data and "text" in input_data:
-            return self._analyze_and_retrieve(
-                image=input_data["image"], 
-                query_text=input_data["text"]
+        with request_context(input_data.get("request_id")), \
+                metrics.track_requests("query_analysis", [input_data], "multimodal2text"):
+            logger.debug("🔍 Running query analysis pipeline with mode: %s", query_type, extra={"query_type": query_type})
+            deadline = Deadline.from_input(input_data, self.deadline_config.get("default_ms"))
+
+            # 只对图文共查模式应用查询分析
+            if query_type == "multimodal2text" and "image" in input_data and "text" in input_data:
+                return self._analyze_and_retrieve(
+                    image=input_data["image"],
+                    query_text=input_data["text"],
+                    deadline=deadline
+                )
+            else:
+                # 对于其他查询类型，直接使用检索管道
+                logger.debug("不支持的查询类型或数据不完整，跳过查询分析步骤: %s", query_type)
+                return {
+                    "results": self.retrieval_pipeline.run(dict(input_data, deadline=deadline)),
+                    "query_analysis": None,
+                    "degradations": deadline.degradations if deadline else []
+                }
+    
+    def run_batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量执行查询分析管道：图文共查请求一次批量生成分析，检索统一走 run_batch"""
+        analyzable = [
+            i for i, input_data in enumerate(inputs)
+            if input_data.get("query_type", "multimodal2text") == "multimodal2text"
+            and "image" in input_data and "text" in input_data
+        ]
+        with metrics.track_requests("query_analysis", inputs, "multimodal2text"):
+            logger.debug("🔍 Running query analysis pipeline batch: %d/%d queries analyzed", len(analyzable), len(inputs))
+            deadlines = [Deadline.from_input(input_data, self.deadline_config.get("default_ms")) for input_data in inputs]
+
+            # 批量生成共用一次 generate，时长受批内最紧的截止时间限制
+            enhanced = self._get_enhanced_queries(
+                [(inputs[i]["image"], inputs[i]["text"]) for i in analyzable],
+                tightest(deadlines[i] for i in analyzable)
             )
+            retrieval_inputs = [dict(input_data, deadline=deadline) for input_data, deadline in zip(inputs, deadlines)]
+            for i, (enhanced_query, _) in zip(analyzable, enhanced):
+                retrieval_inputs[i] = {
+                    "query_type": "multimodal2text", "image": inputs[i]["image"], "text": enhanced_query,
+                    "deadline": deadlines[i]
+                }
+            retrieval_results = self.retrieval_pipeline.run_batch(retrieval_inputs)
+
+            outputs = [{"results": results, "query_analysis": None} for results in retrieval_results]
+            for i, (enhanced_query, analysis_result) in zip(analyzable, enhanced):
+                outputs[i] = self._build_output(inputs[i]["text"], enhanced_query, analysis_result, retrieval_results[i])
+            for output, deadline in zip(outputs, deadlines):
+                output["degradations"] = deadline.degradations if deadline else []
+            return outputs
+
+    def _get_enhanced_queries(self, queries: List[Tuple[Image.Image, str]],
+                              deadline: Optional[Deadline] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """查询缓存，未命中的条目批量调用大模型分析，并缓存成功的分析结果"""
+        analyzer = self.components["query_analyzer"]
+        cache = self.components.get("analysis_cache")
+        enhanced: List[Optional[Tuple[str, Dict[str, Any]]]] = [None] * len(queries)
+        cache_keys = [None] * len(queries)
+        if cache is not None:
+            version = analyzer.cache_version()
+            for i, (image, query_text) in enumerate(queries):
+                cache_keys[i] = cache.make_key(image, query_text, version)
+                cached = cache.get(cache_keys[i])
+                metrics.CACHE_LOOKUPS.inc(cache="query_analysis", result="miss" if cached is None else "hit")
+                if cached is not None:
+                    logger.debug("查询分析缓存命中: '%s'", query_text)
+                    cached["cached"] = True
+                    enhanced[i] = (cached["analysis"]["augmented_query"], cached)
+
+        missing = [i for i, item in enumerate(enhanced) if item is None]
+        if missing:
+            logger.debug("Analyzing %d queries", len(missing))
+            for i, (enhanced_query, analysis_result) in zip(missing, analyzer.get_enhanced_queries([queries[i] for i in missing], deadline)):
+                enhanced[i] = (enhanced_query, analysis_result)
+                if cache is not None and analysis_result["success"]:
+                    cache.put(cache_keys[i], analysis_result)
+        return enhanced
+
+    def _get_enhanced_query(self, image: Image.Image, query_text: str, deadline: Optional[Deadline] = None):
+        """查询缓存，未命中时调用大模型分析，并缓存成功的分析结果"""
+        return self._get_enhanced_queries([(image, query_text)], deadline)[0]
+
+    def run_stream(self, input_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """逐步产出结果：先产出原始查询的基线检索结果，查询分析完成后产出最终结果"""
+        query_type = input_data.get("query_type", "multimodal2text")
+        if query_type == "multimodal2text" and "image" in input_data and "text" in input_data:
+            deadline = Deadline.from_input(input_data, self.deadline_config.get("default_ms"))
+            yield from self._analyze_and_retrieve_stream(input_data["image"], input_data["text"], deadline)
         else:
-            # 对于其他查询类型，直接使用检索管道
-            print(f"不支持的查询类型或数据不完整，跳过查询分析步骤: {query_type}")
-            return {
-                "results": self.retrieval_pipeline.run(input_data),
-                "query_analysis": None
-            }
-    
-    def _analyze_and_retrieve(self, image: Image.Image, query_text: str) -> Dict[str, Any]:
+            output = self.run(input_data)
+            output["stage"] = "final"
+            yield output
+
+    def _analyze_and_retrieve(self, image: Image.Image, query_text: str,
+                              deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """分析查询并执行检索"""
-        # 步骤1: 使用大模型分析查询
-        print(f"Analyzing query: '{query_text}'")
-        enhanced_query, analysis_result = self.components["query_analyzer"].get_enhanced_query(
-            image=image, 
-            query_text=query_text
+        output = None
+        for output in self._analyze_and_retrieve_stream(image, query_text, deadline):
+            pass
+        return output
+
+    def _analyze_and_retrieve_stream(self, image: Image.Image, query_text: str,
+                                     deadline: Optional[Deadline] = None) -> Iterator[Dict[str, Any]]:
+        """查询分析与原始查询检索并行执行，基线结果先于增强结果产出
+
+        有截止时间时，分析未能在截止前完成则放弃等待、直接返回基线结果；
+        截止时间已过则跳过增强检索。
+        """
+        # 生成器跨 yield 不绑定上下文变量，请求 ID 显式传给工作线程与日志
+        request_id = get_request_id() or new_request_id()
+        log_extra = {"request_id": request_id}
+
+        # 步骤1: 原始查询检索与大模型分析同时开始（分析优先读取缓存）
+        baseline_future = self.executor.submit(self.retrieval_pipeline.run, {
+            "query_type": "multimodal2text",
+            "image": image,
+            "text": query_text,  # 使用原始查询
+            "deadline": deadline,
+            "request_id": request_id
+        })
+        analysis_future = self.executor.submit(
+            bind_request_id(self._get_enhanced_query, request_id), image, query_text, deadline
         )
+
+        done, _ = wait([baseline_future, analysis_future], return_when=FIRST_COMPLETED)
+        if baseline_future in done and not analysis_future.done() and baseline_future.exception() is None:
+            # 分析尚未完成，先返回基线结果
+            baseline = self._build_output(query_text, query_text, {"success": False}, baseline_future.result())
+            baseline["query_analysis"] = None
+            baseline["stage"] = "baseline"
+            baseline["degradations"] = deadline.degradations if deadline else []
+            yield baseline
+
+        try:
+            enhanced_query, analysis_result = analysis_future.result(
+                timeout=deadline.remaining() if deadline else None
+            )
+        except TimeoutError:
+            # 生成时长已受限，这里兜底：不再等待分析结果
+            deadline.record("analysis", "abandon_analysis")
+            enhanced_query, analysis_result = query_text, {
+                "success": False, "error": "Deadline exceeded during query analysis."
+            }
         
         # 步骤2: 使用增强的查询文本执行检索
-        if analysis_result["success"]:
-            print(f"使用增强查询执行检索: '{enhanced_query}'")
+        if analysis_result["success"] and deadline is not None and deadline.expired:
+            logger.debug("截止时间已到，跳过增强检索: '%s'", enhanced_query, extra=log_extra)
+            deadline.record("retrieval", "skip_enhanced_retrieval")
+            retrieval_results = baseline_future.result()
+        elif analysis_result["success"]:
+            logger.debug("使用增强查询执行检索: '%s'", enhanced_query, extra=log_extra)
             # 如果分析成功，使用增强查询
             retrieval_results = self.retrieval_pipeline.run({
                 "query_type": "multimodal2text",
                 "image": image,
-                "text": enhanced_query  # 使用增强查询
+                "text": enhanced_query,  # 使用增强查询
+                "deadline": deadline,
+                "request_id": request_id
             })
         else:
-            print(f"查询分析失败，使用原始查询: '{query_text}'")
-            # 如果分析失败，使用原始查询
-            retrieval_results = self.retrieval_pipeline.run({
-                "query_type": "multimodal2text",
-                "image": image,
-                "text": query_text  # 使用原始查询
-            })
+            logger.info("查询分析失败，使用原始查询: '%s'", query_text, extra=log_extra)
+            # 如果分析失败，直接复用原始查询的检索结果
+            retrieval_results = baseline_future.result()
         
         # 返回检索结果和查询分析信息
+        output = self._build_output(query_text, enhanced_query, analysis_result, retrieval_results)
+        output["stage"] = "final"
+        output["degradations"] = deadline.degradations if deadline else []
+        yield output
+
+    @staticmethod
+    def _build_output(query_text: str, enhanced_query: str, analysis_result: Dict[str, Any],
+                      retrieval_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """组装检索结果和查询分析信息"""
         return {
             "results": retrieval_results,
             "query_analysis": analysis_result,
@@ -100,4 +260,4 @@ class QueryAnalysisPipeline(BasePipeline):
                 "explicit": analysis_result.get("analysis", {}).get("explicit_keywords", []) if analysis_result["success"] else [],
                 "implicit": analysis_result.get("analysis", {}).get("implicit_keywords", []) if analysis_result["success"] else []
             }
-        }
\ No newline at end of file
+        }
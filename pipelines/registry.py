@@ -1,29 +1,51 @@
-from typing import Dict, Type, Any
+import importlib
+import logging
+from typing import Dict, Type, Any, Union
 from .base_pipeline import BasePipeline
 
+logger = logging.getLogger(__name__)
+
 class PipelineRegistry:
     """Registry for different pipeline implementations."""
     
-    _registry: Dict[str, Type[BasePipeline]] = {}
+    # Values are classes or "module:Class" paths imported on first use
+    _registry: Dict[str, Union[Type[BasePipeline], str]] = {}
     
     @classmethod
     def register(cls, name: str):
         """Decorator to register a pipeline class."""
         def inner_wrapper(wrapped_class: Type[BasePipeline]):
             if name in cls._registry:
-                print(f"WARNING: Pipeline {name} already exists. Overwriting.")
+                logger.warning("Pipeline %s already exists. Overwriting.", name)
             cls._registry[name] = wrapped_class
             return wrapped_class
         return inner_wrapper
+
+    @classmethod
+    def register_lazy(cls, name: str, path: str):
+        """Register a pipeline by "module:Class" path; the module is imported on first use."""
+        if name in cls._registry:
+            logger.warning("Pipeline %s already exists. Overwriting.", name)
+        cls._registry[name] = path
+
+    @classmethod
+    def get_class(cls, name: str) -> Type[BasePipeline]:
+        """Get a pipeline class by name, importing it if it was registered lazily."""
+        if name not in cls._registry:
+            raise ValueError(f"Pipeline {name} not found in registry.")
+        pipeline_class = cls._registry[name]
+        if isinstance(pipeline_class, str):
+            module_name, class_name = pipeline_class.split(":")
+            pipeline_class = getattr(importlib.import_module(module_name), class_name)
+            cls._registry[name] = pipeline_class
+        return pipeline_class
     
     @classmethod
     def get_pipeline(cls, name: str, config: Dict[str, Any]) -> BasePipeline:
         """Get a pipeline instance by name."""
-        if name not in cls._registry:
-            raise ValueError(f"Pipeline {name} not found in registry.")
-        return cls._registry[name](config)
+        return cls.get_class(name)(config)
     
     @classmethod
-    def list_pipelines(cls) -> Dict[str, Type[BasePipeline]]:
-        """List all registered pipelines."""
+    def list_pipelines(cls) -> Dict[str, Union[Type[BasePipeline], str]]:
+        """List all registered pipelines (lazily registered ones as their "module:Class" path)."""
         return cls._registry.copy() 
\ No newline at end of file
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Callable, List
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Process-wide registry of heavy resources shared between pipelines.
+
+    Models, preprocessed feature stores and indexes are keyed by what they were
+    built from (model path, data and index configuration), so pipelines in one
+    process that need the same resource get the same instance instead of loading
+    it again.
+    """
+
+    _resources: Dict[str, Any] = {}
+    _locks: Dict[str, threading.Lock] = {}
+    _guard = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, *parts) -> str:
+        """Build a stable key from a resource kind and its JSON-serializable inputs."""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return f"{kind}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    @classmethod
+    def get_or_create(cls, key: str, factory: Callable[[], Any]) -> Any:
+        """Return the resource for `key`, building it with `factory` on first use."""
+        with cls._guard:
+            if key in cls._resources:
+                return cls._resources[key]
+            lock = cls._locks.setdefault(key, threading.Lock())
+
+        # Build outside the global guard so unrelated resources can load concurrently
+        with lock:
+            with cls._guard:
+                if key in cls._resources:
+                    return cls._resources[key]
+            logger.info("Creating shared resource: %s", key)
+            value = factory()
+            with cls._guard:
+                cls._resources[key] = value
+            return value
+
+    @classmethod
+    def get_model(cls, model_config_path: str):
+        """Shared BaseModel (model + tokenizer) for a model config file."""
+        model_config_path = os.path.abspath(model_config_path)
+        with open(model_config_path, "r") as f:
+            model_config = yaml.safe_load(f)["model"]
+        key = cls.make_key("model", model_config["path"], model_config.get("device"))
+
+        def load():
+            from src.base import BaseModel
+            return BaseModel(model_config_path)
+
+        return cls.get_or_create(key, load)
+
+    @classmethod
+    def release(cls, key: str):
+        """Drop a resource and close what it holds; call once no pipeline uses it anymore."""
+        with cls._guard:
+            value = cls._resources.pop(key, None)
+            cls._locks.pop(key, None)
+        if value is not None:
+            cls._close(key, value)
+
+    @classmethod
+    def clear(cls):
+        with cls._guard:
+            resources = list(cls._resources.items())
+            cls._resources.clear()
+            cls._locks.clear()
+        for key, value in resources:
+            cls._close(key, value)
+
+    @staticmethod
+    def _close(key: str, value: Any):
+        """Close the indexes (shard workers), docstores (mmaps, file handles) and other
+        closable parts of a resource; preprocessed data is a dict of them."""
+        parts = value.values() if isinstance(value, dict) else [value]
+        for part in parts:
+            close = getattr(part, "close", None)
+            if not callable(close):
+                continue
+            try:
+                close()
+            except Exception as e:
+                logger.warning("Failed to close %s of shared resource %s: %s", type(part).__name__, key, e)
+
+    @classmethod
+    def keys(cls) -> List[str]:
+        with cls._guard:
+            return list(cls._resources.keys())
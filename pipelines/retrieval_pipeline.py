@@ -1,4 +1,5 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import logging
 import torch
 import numpy as np
 from PIL import Image
@@ -6,28 +7,48 @@ import os
 
 from .base_pipeline import BasePipeline
 from .factory import ComponentFactory
-from src.encoding.image_encoder import encode_image
-from src.encoding.text_encoder import encode_text
-from src.encoding.joint_encoder import encode_image_text
+from .resources import ResourceRegistry
+from src.encoding.image_encoder import encode_images
+from src.encoding.text_encoder import encode_texts
+from src.encoding.embedding_cache import EmbeddingCache
+from src.indexing.base_indexer import LazyIndex
+from src.deadline import Deadline
+from src.logging_utils import request_context
+from src import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class RetrievalPipeline(BasePipeline):
+    # Which index each query type searches
+    QUERY_MODALITIES = {
+        "text2image": "image",
+        "text2text": "text",
+        "image2text": "text",
+        "multimodal2text": "text"
+    }
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
+        if "metrics" in self.config:
+            metrics.configure(self.config["metrics"])
+        self.deadline_config = self.config.get("deadline", {})
+        # Running estimate of the cost of encoding one text window, used to cap windows under a deadline
+        self._window_seconds = self.deadline_config.get("window_cost_ms", 15) / 1000.0
+        self.enabled_query_types = self._enabled_query_types()
         self.preprocessed_data = self._load_or_preprocess_data()
-        print("🚀 RetrievalPipeline initialized successfully!")
+        logger.info("🚀 RetrievalPipeline initialized successfully!")
 
     def _initialize_components(self) -> Dict[str, Any]:
         """Initialize encoder, indexer and retriever components."""
         components = {}
         
-        print("⚙️ Initializing pipeline components...")
+        logger.info("⚙️ Initializing pipeline components...")
         
-        # Initialize model and tokenizer
-        from src.base import BaseModel
+        # Initialize model and tokenizer (shared by all pipelines in this process)
         model_config_path = os.path.abspath(self.config["model_config_path"])
-        print(f"Loading base model from: {model_config_path}")
-        model = BaseModel(model_config_path)
+        logger.info("Loading base model from: %s", model_config_path)
+        model = ResourceRegistry.get_model(model_config_path)
         components["model"] = model.model
         components["tokenizer"] = model.tokenizer
         components["device"] = model.device
@@ -38,7 +59,7 @@ class RetrievalPipeline(BasePipeline):
         )
         
         # Initialize indexer
-        components["indexer"] = ComponentFactory.create_component(
+        components["indexer"] = ComponentFactory.get_shared_component(
             "indexer", self.config["indexer"]
         )
         
@@ -46,142 +67,348 @@ class RetrievalPipeline(BasePipeline):
         components["retriever"] = ComponentFactory.create_component(
             "retriever", self.config["retriever"]
         )
+
+        # Initialize optional query embedding cache
+        if self.config.get("query_cache", {}).get("enabled", False):
+            components["query_cache"] = EmbeddingCache(self.config["query_cache"])
+
+        # Initialize optional exact re-ranker for two-stage retrieval
+        if "reranker" in self.config:
+            components["reranker"] = ComponentFactory.create_component(
+                "reranker", self.config["reranker"]
+            )
         
         return components
     
+    def _enabled_query_types(self) -> List[str]:
+        """Query types served from startup (`enabled_query_types`, default all)."""
+        enabled = self.config.get("enabled_query_types")
+        if enabled is None:
+            return list(self.QUERY_MODALITIES)
+        unknown = [query_type for query_type in enabled if query_type not in self.QUERY_MODALITIES]
+        if unknown:
+            raise ValueError(f"Unsupported query types in enabled_query_types: {unknown}")
+        return list(enabled)
+
     def _load_or_preprocess_data(self):
-        """Load preprocessed data or preprocess it if needed."""
-        print("🔄 Loading or preprocessing data...")
-        preprocessor = ComponentFactory.create_component(
-            "preprocessor", self.config["preprocessor"]
-        )
-        
-        return preprocessor.process_data(
+        """Load preprocessed data or preprocess it if needed.
+
+        The resulting features, metadata and indexes are shared with every pipeline in
+        this process that uses the same model, data, preprocessor and indexer settings.
+        Indexes searched by an enabled query type are loaded now; the others are built
+        or loaded when a query first needs them.
+        """
+        eager = {self.QUERY_MODALITIES[query_type] for query_type in self.enabled_query_types}
+        lazy = set(self.QUERY_MODALITIES.values()) - eager
+        key = ResourceRegistry.make_key(
+            "data",
+            getattr(self.components["model"], "name_or_path", None),
             self.config["data"],
-            self.components["model"],
-            self.components["tokenizer"],
-            self.components["indexer"]
+            self.config["preprocessor"],
+            self.config["indexer"]
         )
+
+        def build():
+            logger.info("🔄 Loading or preprocessing data...")
+            preprocessor = ComponentFactory.create_component(
+                "preprocessor", self.config["preprocessor"]
+            )
+            return preprocessor.process_data(
+                self.config["data"],
+                self.components["model"],
+                self.components["tokenizer"],
+                self.components["indexer"],
+                lazy_indexes=lazy
+            )
+
+        data = ResourceRegistry.get_or_create(key, build)
+        # Shared data may come from a pipeline that deferred an index this one serves
+        for modality in eager:
+            index = data[f"{modality}_index"]
+            if isinstance(index, LazyIndex):
+                index.load()
+        return data
     
     def run(self, input_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Execute the retrieval pipeline based on the query type."""
+        """Execute the retrieval pipeline based on the query type.
+
+        A request may carry `deadline_ms` or a `Deadline` object under `deadline`; the
+        degradations applied to meet it are recorded on that object.
+        """
         query_type = input_data["query_type"]
-        print(f"🔍 Running {query_type} query...")
-        
-        if query_type == "text2image":
-            return self._retrieve_by_text(input_data["text"])
-        elif query_type == "image2text":
-            return self._retrieve_by_image(input_data["image"])
-        elif query_type == "multimodal2text":
-            return self._retrieve_by_image_and_text(input_data["image"], input_data["text"])
-        elif query_type == "text2text":
-            return self._retrieve_text_by_text(input_data["text"])
-        else:
+        if query_type not in self.QUERY_MODALITIES:
             raise ValueError(f"Unsupported query type: {query_type}")
-    
-    def _retrieve_by_text(self, query_text: str) -> List[Dict[str, Any]]:
-        """Retrieve images based on text query."""
-        print(f"Processing text query: {query_text[:50]}...")
-        query_features = encode_text(
-            self.components["model"], 
-            self.components["tokenizer"], 
-            query_text, 
-            self.config["max_token_length"], 
-            self.config["stride"]
+
+        with request_context(input_data.get("request_id")), metrics.track_requests("retrieval", [input_data]):
+            logger.debug("🔍 Running %s query...", query_type, extra={"query_type": query_type})
+            deadline = Deadline.from_input(input_data, self.deadline_config.get("default_ms"))
+
+            if query_type == "text2image":
+                return self._retrieve_by_text(input_data["text"], deadline)
+            elif query_type == "image2text":
+                return self._retrieve_by_image(input_data["image"], deadline)
+            elif query_type == "multimodal2text":
+                return self._retrieve_by_image_and_text(input_data["image"], input_data["text"], deadline)
+            else:
+                return self._retrieve_text_by_text(input_data["text"], deadline)
+
+    def run_batch(self, inputs: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Execute many queries at once, returning one result list per input in input order.
+
+        Inputs are grouped by query type and batch-encoded per group; all queries that
+        target the same index are then searched with a single stacked query matrix.
+        """
+        # Counted before validation so that a batch failing here is still accounted for once
+        with metrics.track_requests("retrieval", inputs):
+            deadlines = [Deadline.from_input(input_data, self.deadline_config.get("default_ms")) for input_data in inputs]
+            groups: Dict[str, List[int]] = {}
+            for position, input_data in enumerate(inputs):
+                query_type = input_data["query_type"]
+                if query_type not in self.QUERY_MODALITIES:
+                    raise ValueError(f"Unsupported query type: {query_type}")
+                groups.setdefault(query_type, []).append(position)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 Running batch of %d queries: %s", len(inputs),
+                             ", ".join(f"{k}={len(v)}" for k, v in groups.items()),
+                             extra={"request_ids": [input_data.get("request_id") for input_data in inputs]})
+
+            per_index: Dict[str, List] = {}
+            for query_type, positions in groups.items():
+                query_features = self._encode_queries(
+                    query_type, [inputs[p] for p in positions], [deadlines[p] for p in positions]
+                )
+                per_index.setdefault(self.QUERY_MODALITIES[query_type], []).append((positions, query_features))
+
+            results: List[List[Dict[str, Any]]] = [[] for _ in inputs]
+            for modality, parts in per_index.items():
+                positions = [p for part_positions, _ in parts for p in part_positions]
+                D, I = self._search(
+                    modality, np.concatenate([feats for _, feats in parts], axis=0), [deadlines[p] for p in positions]
+                )
+                for row, position in enumerate(positions):
+                    results[position] = self._format_hits(modality, D[row], I[row])
+            return results
+
+    def _encode_queries(self, query_type: str, inputs: List[Dict[str, Any]],
+                        deadlines: Optional[List[Optional[Deadline]]] = None) -> np.ndarray:
+        """Batch-encode the queries of one type into a float32 matrix, serving repeats from the cache."""
+        deadlines = deadlines or [None] * len(inputs)
+        cache = self.components.get("query_cache")
+        if cache is None:
+            return self._encode_uncached(query_type, inputs, deadlines)[0]
+
+        keys = [self._cache_key(query_type, item) for item in inputs]
+        feats = [cache.get(key) for key in keys]
+        missing = [i for i, feat in enumerate(feats) if feat is None]
+        metrics.CACHE_LOOKUPS.inc(len(keys) - len(missing), cache="query_embedding", result="hit")
+        metrics.CACHE_LOOKUPS.inc(len(missing), cache="query_embedding", result="miss")
+        if missing:
+            encoded, truncated = self._encode_uncached(
+                query_type, [inputs[i] for i in missing], [deadlines[i] for i in missing]
+            )
+            for i, feat, was_truncated in zip(missing, encoded, truncated):
+                feats[i] = feat
+                # Embeddings of window-truncated texts are approximations; do not cache them
+                # (the row is copied so the entry does not keep the whole batch array alive)
+                if not was_truncated:
+                    cache.put(keys[i], np.array(feat, copy=True))
+        return np.stack(feats)
+
+    def _cache_key(self, query_type: str, input_data: Dict[str, Any]):
+        max_token_length = self.config["max_token_length"]
+        stride = self.config["stride"]
+        if query_type in ("text2image", "text2text"):
+            return EmbeddingCache.text_key(input_data["text"], max_token_length, stride)
+        if query_type == "image2text":
+            return EmbeddingCache.image_key(input_data["image"])
+        return EmbeddingCache.joint_key(
+            input_data["image"], input_data["text"], max_token_length, stride,
+            self.components["encoder"].combine_method
         )
+
+    def _encode_uncached(self, query_type: str, inputs: List[Dict[str, Any]],
+                         deadlines: List[Optional[Deadline]]) -> Tuple[np.ndarray, List[bool]]:
+        """Run the encoders for queries of one type.
+
+        Returns the features and, per query, whether its text was truncated to fewer
+        sliding windows to fit its own deadline.
+        """
+        model = self.components["model"]
+        tokenizer = self.components["tokenizer"]
+        batch_size = self.config.get("query_batch_size", 64)
+        if query_type == "image2text":
+            feats = encode_images(model, [item["image"] for item in inputs])
+            return feats.numpy().astype(np.float32), [False] * len(inputs)
+
+        max_windows = [self._window_cap(deadline) for deadline in deadlines]
+        window_counts: List[int] = []
+        # Text encoding time of either path feeds the per-window cost estimate used by `_window_cap`
+        encode_seconds: List[float] = []
+        if query_type in ("text2image", "text2text"):
+            feats = encode_texts(
+                model, tokenizer, [item["text"] for item in inputs],
+                self.config["max_token_length"], self.config["stride"], batch_size,
+                max_windows=max_windows, window_counts=window_counts, encode_seconds=encode_seconds
+            )
+        else:
+            feats = self.components["encoder"].encode_batch(
+                model, tokenizer, [item["image"] for item in inputs], [item["text"] for item in inputs],
+                self.config["max_token_length"], self.config["stride"], batch_size,
+                max_windows=max_windows, window_counts=window_counts, encode_seconds=encode_seconds
+            )
+        encoded_windows = sum(min(count, cap or count) for count, cap in zip(window_counts, max_windows))
+        self._update_window_cost(sum(encode_seconds), encoded_windows)
+
+        truncated = [cap is not None and count > cap for count, cap in zip(window_counts, max_windows)]
+        for deadline, count, cap, was_truncated in zip(deadlines, window_counts, max_windows, truncated):
+            if was_truncated:
+                deadline.record("encode", "truncate_windows", windows=count, max_windows=cap)
+        return feats.numpy().astype(np.float32), truncated
+
+    def _window_cap(self, deadline: Optional[Deadline]) -> Optional[int]:
+        """Most text windows per query that fit the encode share of the remaining budget."""
+        if deadline is None:
+            return None
+        budget = deadline.remaining() * self.deadline_config.get("encode_share", 0.5)
+        return max(1, int(budget / self._window_seconds))
+
+    def _update_window_cost(self, elapsed: float, windows: int):
+        if windows > 0:
+            self._window_seconds = 0.8 * self._window_seconds + 0.2 * (elapsed / windows)
+
+    def _format_hits(self, modality: str, similarities: np.ndarray, ids: np.ndarray) -> List[Dict[str, Any]]:
+        """Turn one row of search output into result dicts."""
+        results = []
+        with metrics.stage("metadata"):
+            for i, similarity in zip(ids, similarities):
+                if i < 0:
+                    # ANN indexes return -1 when fewer than top_k candidates were found
+                    continue
+                if modality == "image":
+                    results.append({
+                        "path": self.preprocessed_data["image_paths"][i],
+                        "similarity": float(similarity),
+                        "type": "image"
+                    })
+                elif i < len(self.preprocessed_data["text_ids"]):
+                    results.append({
+                        "id": self.preprocessed_data["text_ids"][i],
+                        "content": self.preprocessed_data["text_contents"][i],
+                        "similarity": float(similarity),
+                        "type": "text"
+                    })
+                else:
+                    logger.warning("Invalid index %d for text_ids with length %d", i, len(self.preprocessed_data["text_ids"]))
+        return results
+
+    def _search(self, modality: str, query_features: np.ndarray,
+                deadlines: Optional[List[Optional[Deadline]]] = None):
+        """Search the `modality` index, re-ranking over-fetched candidates exactly if enabled.
+
+        Degradation is decided per query: a query whose deadline is running out is
+        searched with reduced ANN effort (nprobe / efSearch) and without the exact
+        re-rank, while the other queries of the same batch keep full quality. Queries
+        sharing the same settings are still searched together.
+        """
+        deadlines = deadlines or [None] * len(query_features)
+        settings = [self._search_settings(deadline) for deadline in deadlines]
+        groups: Dict[Tuple[bool, Optional[float]], List[int]] = {}
+        for row, setting in enumerate(settings):
+            groups.setdefault(setting, []).append(row)
+        if len(groups) == 1:
+            (rerank, scale), = groups
+            return self._search_group(modality, query_features, rerank, scale, deadlines)
+
+        top_k = self.config["top_k"]
+        D = np.empty((len(query_features), top_k), dtype=np.float32)
+        I = np.empty((len(query_features), top_k), dtype=np.int64)
+        for (rerank, scale), rows in groups.items():
+            D[rows], I[rows] = self._search_group(
+                modality, query_features[rows], rerank, scale, [deadlines[row] for row in rows]
+            )
+        return D, I
+
+    def _search_settings(self, deadline: Optional[Deadline]) -> Tuple[bool, Optional[float]]:
+        """(re-rank, search effort scale) for one query; scale None means full effort."""
+        reranker = self.components.get("reranker")
+        rerank = reranker is not None and reranker.enabled
+        if deadline is None:
+            return rerank, None
+        fraction = deadline.fraction_remaining()
+        if fraction < self.deadline_config.get("skip_rerank_below", 0.2):
+            rerank = False
+        threshold = self.deadline_config.get("search_degrade_below", 0.5)
+        if fraction >= threshold:
+            return rerank, None
+        # Rounded so that queries with nearly the same budget left share one search call
+        return rerank, round(max(self.deadline_config.get("min_search_scale", 0.1), fraction / threshold), 2)
+
+    def _search_group(self, modality: str, query_features: np.ndarray, rerank: bool,
+                      scale: Optional[float], deadlines: List[Optional[Deadline]]):
+        """Search queries that share the same degradation settings, recording them on each query."""
+        index = self.preprocessed_data[f"{modality}_index"]
+        top_k = self.config["top_k"]
+        reranker = self.components.get("reranker")
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if reranker is not None and reranker.enabled and not rerank:
+            for deadline in deadlines:
+                deadline.record("rerank", "skip_rerank")
+
+        k = reranker.candidate_count(top_k, index.ntotal) if rerank else top_k
+        params = None
+        if scale is not None:
+            params = self.components["indexer"].search_params(scale, k)
+            if params is not None:
+                for deadline in deadlines:
+                    deadline.record("search", "reduce_search_effort", scale=scale)
+        if not rerank:
+            with metrics.stage("search"):
+                return index.search(query_features, top_k, params=params)
+
+        with metrics.stage("search"):
+            _, candidate_ids = index.search(query_features, k, params=params)
+        with metrics.stage("rerank"):
+            return reranker.rerank(query_features, candidate_ids, self.preprocessed_data[f"{modality}_features"], top_k)
+
+    def _retrieve_by_text(self, query_text: str, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """Retrieve images based on text query."""
+        logger.debug("Processing text query: %s...", query_text[:50])
+        query_features = self._encode_queries("text2image", [{"text": query_text}], [deadline])
         
         # Search in the image index
-        D, I = self.preprocessed_data["image_index"].search(
-            query_features.numpy().astype(np.float32), 
-            self.config["top_k"]
-        )
+        D, I = self._search("image", query_features, [deadline])
         
-        results = []
-        for i, similarity in zip(I[0], D[0]):
-            results.append({
-                "path": self.preprocessed_data["image_paths"][i],
-                "similarity": float(similarity),
-                "type": "image"
-            })
-        
-        return results
+        return self._format_hits("image", D[0], I[0])
     
-    def _retrieve_text_by_text(self, query_text: str) -> List[Dict[str, Any]]:
+    def _retrieve_text_by_text(self, query_text: str, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """Retrieve texts based on text query."""
-        print(f"Processing text2text query: {query_text[:50]}...")
-        query_features = encode_text(
-            self.components["model"], 
-            self.components["tokenizer"], 
-            query_text, 
-            self.config["max_token_length"], 
-            self.config["stride"]
-        )
+        logger.debug("Processing text2text query: %s...", query_text[:50])
+        query_features = self._encode_queries("text2text", [{"text": query_text}], [deadline])
         
         # Search in the text index
-        D, I = self.preprocessed_data["text_index"].search(
-            query_features.numpy().astype(np.float32), 
-            self.config["top_k"]
-        )
-        
-        results = []
-        for i, similarity in zip(I[0], D[0]):
-            if i < len(self.preprocessed_data["text_ids"]):
-                results.append({
-                    "id": self.preprocessed_data["text_ids"][i],
-                    "content": self.preprocessed_data["text_contents"][i],
-                    "similarity": float(similarity),
-                    "type": "text"
-                })
-            else:
-                print(f"Warning: Invalid index {i} for text_ids with length {len(self.preprocessed_data['text_ids'])}")
+        D, I = self._search("text", query_features, [deadline])
         
-        print(f"Found {len(results)} matching texts for text query")
+        results = self._format_hits("text", D[0], I[0])
+        logger.debug("Found %d matching texts for text query", len(results))
         return results
     
-    def _retrieve_by_image(self, query_image: Image.Image) -> List[Dict[str, Any]]:
+    def _retrieve_by_image(self, query_image: Image.Image, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """Retrieve texts based on image query."""
-        print("Processing image query...")
-        query_features = encode_image(self.components["model"], query_image)
+        logger.debug("Processing image query...")
+        query_features = self._encode_queries("image2text", [{"image": query_image}], [deadline])
         
         # Search in the text index
-        D, I = self.preprocessed_data["text_index"].search(
-            query_features.numpy().astype(np.float32), 
-            self.config["top_k"]
-        )
-        
-        results = []
-        for i, similarity in zip(I[0], D[0]):
-            results.append({
-                "id": self.preprocessed_data["text_ids"][i],
-                "content": self.preprocessed_data["text_contents"][i],
-                "similarity": float(similarity),
-                "type": "text"
-            })
+        D, I = self._search("text", query_features, [deadline])
         
-        return results
+        return self._format_hits("text", D[0], I[0])
     
-    def _retrieve_by_image_and_text(self, query_image: Image.Image, query_text: str) -> List[Dict[str, Any]]:
+    def _retrieve_by_image_and_text(self, query_image: Image.Image, query_text: str,
+                                    deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """Retrieve texts based on combined image and text query."""
-        print(f"Processing multimodal query with text: {query_text[:50]}...")
-        query_feat = encode_image_text(
-            self.components["model"], 
-            self.components["tokenizer"], 
-            query_image, 
-            query_text, 
-            self.config["max_token_length"], 
-            self.config["stride"]
-        )
+        logger.debug("Processing multimodal query with text: %s...", query_text[:50])
+        query_features = self._encode_queries("multimodal2text", [{"image": query_image, "text": query_text}], [deadline])
         
         # Search in the text index
-        D, I = self.preprocessed_data["text_index"].search(query_feat, self.config["top_k"])
-        
-        results = []
-        for i, similarity in zip(I[0], D[0]):
-            results.append({
-                "id": self.preprocessed_data["text_ids"][i],
-                "content": self.preprocessed_data["text_contents"][i],
-                "similarity": float(similarity),
-                "type": "text"
-            })
+        D, I = self._search("text", query_features, [deadline])
         
-        return results
\ No newline at end of file
+        return self._format_hits("text", D[0], I[0])
@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Tuple
+
+from src.deadline import Deadline
+from src.logging_utils import get_request_id
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = metrics.REGISTRY.histogram(
+    "mmr_scheduler_batch_size", "Requests coalesced per micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+class MicroBatchScheduler:
+    """Coalesces concurrent requests into batched pipeline calls.
+
+    Requests arriving within `max_wait_ms` of the first queued request (up to
+    `max_batch_size` of them) are executed together through `pipeline.run_batch`,
+    and each caller's future is resolved with its own results.
+    """
+
+    def __init__(self, pipeline, config: Dict[str, Any]):
+        self.pipeline = pipeline
+        self.config = config
+        self.max_batch_size = config.get("max_batch_size", 16)
+        self.max_wait_ms = config.get("max_wait_ms", 10)
+        self.batches = 0
+        self.requests = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="micro-batch-scheduler", daemon=True)
+        self._worker.start()
+        logger.info("Micro-batch scheduler started (max_batch_size=%d, max_wait_ms=%s)", self.max_batch_size, self.max_wait_ms)
+
+    def submit(self, input_data: Dict[str, Any]) -> Future:
+        """Queue a request and return a future for its results."""
+        if self._closed:
+            raise RuntimeError("Scheduler is closed")
+        future = Future()
+        # Request latency metrics count from here, including the time spent queued
+        input_data = dict(input_data, submitted_at=time.perf_counter())
+        if "deadline_ms" in input_data and "deadline" not in input_data:
+            # Start the clock now so that time spent queued counts against the budget
+            input_data = dict(input_data, deadline=Deadline(float(input_data["deadline_ms"])))
+        if "request_id" not in input_data and get_request_id() is not None:
+            # The request runs on the scheduler thread; carry the caller's request id along
+            input_data = dict(input_data, request_id=get_request_id())
+        self._queue.put((input_data, future))
+        return future
+
+    def run(self, input_data: Dict[str, Any], timeout: float = None) -> List[Dict[str, Any]]:
+        """Blocking drop-in replacement for `pipeline.run`."""
+        return self.submit(input_data).result(timeout)
+
+    def close(self):
+        """Stop the worker after the requests already queued have been served."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0
+        }
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            window_end = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = window_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[Dict[str, Any], Future]]):
+        batch = [(input_data, future) for input_data, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        BATCH_SIZE.observe(len(batch))
+
+        try:
+            results = self.pipeline.run_batch([input_data for input_data, _ in batch])
+        except Exception as e:
+            # Isolate the failing request(s) instead of failing the whole batch
+            logger.warning("Batched execution failed (%s), running %d requests individually", e, len(batch))
+            for input_data, future in batch:
+                try:
+                    # run_batch has already counted and timed these requests
+                    with metrics.untracked_requests():
+                        future.set_result(self.pipeline.run(input_data))
+                except Exception as inner:
+                    future.set_exception(inner)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
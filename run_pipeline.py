@@ -6,6 +6,7 @@ import argparse
 import yaml
 from PIL import Image
 from pipelines import PipelineRegistry
+from src.logging_utils import setup_logging
 
 def parse_args():
     parser = argparse.ArgumentParser(description="多模态检索系统 - Pipeline使用示例")
@@ -20,6 +21,7 @@ def parse_args():
 
 def main():
     args = parse_args()
+    setup_logging()
     
     # 加载pipeline配置
     config_path = os.path.abspath(args.config)
@@ -98,6 +100,11 @@ def main():
             print(f"   {result['content'][:100]}...")
             print()
 
+    # 两阶段检索统计：精确重排序改变了多少次近似检索的结果
+    if "reranker" in pipeline.components:
+        stats = pipeline.components["reranker"].stats()
+        print(f"重排序统计: {stats['reordered_queries']}/{stats['reranked_queries']} 次查询的结果顺序被修正")
+
 if __name__ == "__main__":
     try:
         main()
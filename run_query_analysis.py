@@ -7,6 +7,7 @@ import yaml
 from PIL import Image
 import json
 from pipelines import PipelineRegistry
+from src.logging_utils import setup_logging
 
 def parse_args():
     parser = argparse.ArgumentParser(description="多模态查询分析和检索系统 - 示例")
@@ -24,6 +25,7 @@ def parse_args():
 
 def main():
     args = parse_args()
+    setup_logging()
     
     # 加载管道配置
     config_path = os.path.abspath(args.config)
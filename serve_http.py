@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# serve_http.py - 无界面的 HTTP 服务入口（JSON over HTTP）
+
+import os
+import argparse
+import tempfile
+import yaml
+from handlers.http_server import run_server
+from src.logging_utils import setup_logging
+
+STUB_MODEL_CONFIG = "config/stub_model_config.yaml"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多模态检索系统 - HTTP 服务")
+    parser.add_argument("--config", type=str, default="config/pipeline_config.yaml",
+                        help="检索管道配置文件路径")
+    parser.add_argument("--qa-config", type=str, default=None,
+                        help="查询分析管道配置文件路径（不指定则不提供 /v1/analyze）")
+    parser.add_argument("--host", type=str, help="监听地址（覆盖配置中的 server.host）")
+    parser.add_argument("--port", type=int, help="监听端口（覆盖配置中的 server.port）")
+    parser.add_argument("--workers", type=int, help="模型/索引工作线程数（覆盖配置中的 server.workers）")
+    parser.add_argument("--stub", action="store_true",
+                        help="使用 stub 模型、stub 查询分析器与本地合成语料，便于本地测试")
+    parser.add_argument("--data-dir", type=str, default=None,
+                        help="stub 模式的语料目录（images/ 与 texts.jsonl，不存在时自动生成；默认使用临时目录）")
+    parser.add_argument("--stub-images", type=int, default=200, help="stub 模式生成的图像数量")
+    parser.add_argument("--stub-texts", type=int, default=1000, help="stub 模式生成的文本数量")
+    return parser.parse_args()
+
+def load_config(path):
+    with open(os.path.abspath(path), "r") as f:
+        return yaml.safe_load(f)
+
+def stub_data(args):
+    """stub 模式使用的本地语料：--data-dir 下已有的语料，或用 benchmarks.synthetic 生成的合成语料。"""
+    from benchmarks.synthetic import make_corpus
+
+    data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="mmr_stub_"))
+    data_config = {
+        "image_folder": os.path.join(data_dir, "images"),
+        "text_jsonl": os.path.join(data_dir, "texts.jsonl"),
+    }
+    if not (os.path.isdir(data_config["image_folder"]) and os.path.exists(data_config["text_jsonl"])):
+        print(f"生成合成语料: {args.stub_images} 张图像, {args.stub_texts} 条文本 -> {data_dir}")
+        data_config = make_corpus(data_dir, args.stub_images, args.stub_texts)
+    return data_dir, data_config
+
+def main():
+    args = parse_args()
+    setup_logging()
+
+    retrieval_config = load_config(args.config)
+    query_analysis_config = load_config(args.qa_config) if args.qa_config else None
+
+    if args.stub:
+        print(f"使用 stub 模型: {STUB_MODEL_CONFIG}")
+        # 配置文件中的语料与缓存路径指向生产数据，stub 模式改用本地语料，缓存也放在语料目录下
+        data_dir, data_config = stub_data(args)
+        cache_dir = os.path.join(data_dir, "cache")
+        for config in filter(None, [retrieval_config, query_analysis_config]):
+            config["model_config_path"] = STUB_MODEL_CONFIG
+            config["data"] = data_config
+            config.setdefault("preprocessor", {}).setdefault("params", {})["cache_dir"] = cache_dir
+            if "analysis_cache" in config:
+                config["analysis_cache"]["path"] = os.path.join(cache_dir, "query_analysis.sqlite")
+        if query_analysis_config is not None:
+            query_analysis_config.setdefault("query_analyzer", {})["model_path"] = "stub"
+
+    # 命令行参数覆盖配置文件中的服务设置
+    server_config = dict(retrieval_config.get("server", {}))
+    for key in ("host", "port", "workers"):
+        value = getattr(args, key)
+        if value is not None:
+            server_config[key] = value
+
+    run_server(retrieval_config, query_analysis_config, server_config)
+
+if __name__ == "__main__":
+    main()
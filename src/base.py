@@ -1,6 +1,5 @@
 # src/base.py
 import torch
-from transformers import AutoModel, AutoTokenizer
 import yaml
 
 class BaseModel:
@@ -8,6 +7,14 @@ class BaseModel:
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         self.model_path = self.config['model']['path']
+        if self.model_path == "stub":
+            # Deterministic CPU model for local testing without downloading weights
+            from src.encoding.stub_model import StubModel, StubTokenizer
+            self.device = "cpu"
+            self.model = StubModel(self.config['model'].get('dim', 512))
+            self.tokenizer = StubTokenizer()
+            return
+        from transformers import AutoModel, AutoTokenizer
         self.device = self.config['model']['device'] if torch.cuda.is_available() else "cpu"
         self.model = AutoModel.from_pretrained(self.model_path, trust_remote_code=True)
         self.model.set_processor(self.model_path)
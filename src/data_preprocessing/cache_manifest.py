@@ -0,0 +1,81 @@
+# src/data_preprocessing/cache_manifest.py
+import logging
+import os
+import json
+import hashlib
+from typing import Dict, Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def cache_key(model_path: str, max_token_length: int, stride: int) -> str:
+    """Fingerprint of the settings that make cached features reusable."""
+    payload = json.dumps({
+        "version": MANIFEST_VERSION,
+        "model_path": model_path,
+        "max_token_length": max_token_length,
+        "stride": stride
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def image_fingerprint(path: str) -> List[int]:
+    """Cheap change detector for an image file: size and modification time."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def text_fingerprint(record: Dict[str, Any]) -> str:
+    """Content hash of a JSONL text record."""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def data_digest(key: str, fingerprints: Iterable[Any]) -> str:
+    """Fingerprint of the exact rows, in order, that a feature matrix was built from.
+
+    Hashes `json.dumps([key, fingerprints])` incrementally, so `fingerprints` may be a generator.
+    """
+    digest = hashlib.sha1(f"[{json.dumps(key)}, [".encode("utf-8"))
+    for i, fingerprint in enumerate(fingerprints):
+        digest.update(((", " if i else "") + json.dumps(fingerprint)).encode("utf-8"))
+    digest.update(b"]]")
+    return digest.hexdigest()
+
+
+def load_manifest(path: str, key: str) -> Optional[Dict[str, Any]]:
+    """Load a manifest, returning None if it is missing or was built with other settings."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable cache manifest %s: %s", path, e)
+        return None
+    if manifest.get("cache_key") != key:
+        logger.info("Cache was built with a different model or tokenization settings, re-encoding.")
+        return None
+    return manifest
+
+
+def save_manifest(path: str, key: str, image_fingerprints: Iterable[List[int]], text_fingerprints: Iterable[str],
+                  failed_images: Optional[Dict[str, List[int]]] = None):
+    """Atomically write the manifest for the rows currently in the feature cache.
+
+    Fingerprints are written one at a time, so they may be generators. `failed_images`
+    maps images that could not be decoded or encoded to their fingerprint, so that they
+    are skipped rather than retried until the file changes.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps({"version": MANIFEST_VERSION, "cache_key": key})[:-1])
+        for name, fingerprints in (("images", image_fingerprints), ("texts", text_fingerprints)):
+            f.write(f", {json.dumps(name)}: [")
+            for i, fingerprint in enumerate(fingerprints):
+                f.write((", " if i else "") + json.dumps(fingerprint))
+            f.write("]")
+        f.write(f", \"failed_images\": {json.dumps(failed_images or {})}}}")
+    os.replace(tmp_path, path)
@@ -0,0 +1,102 @@
+# src/data_preprocessing/docstore.py
+import array
+import json
+import mmap
+import operator
+import os
+import zlib
+import numpy as np
+from typing import Iterable, Iterator, Optional
+
+DOCSTORE_VERSION = 1
+COMPRESSIONS = (None, "zlib")
+
+
+class DocStore:
+    """Read-only, memory-mapped store of string records with O(1) access by row id.
+
+    A store `<prefix>` consists of three files:
+      <prefix>.data         concatenated UTF-8 records, each optionally zlib-compressed
+      <prefix>.offsets.npy  uint64 array of N + 1 byte offsets into the data file
+      <prefix>.json         header with record count and compression
+
+    Records are only decoded when accessed, so a corpus costs page cache instead of
+    resident Python strings. Supports `len`, indexing and iteration like a list.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        with open(prefix + ".json", "r") as f:
+            header = json.load(f)
+        if header.get("version") != DOCSTORE_VERSION:
+            raise ValueError(f"Unsupported docstore version {header.get('version')} in {prefix}.json")
+        self.compression = header["compression"]
+        self.offsets = np.load(prefix + ".offsets.npy", mmap_mode="r")
+        if len(self.offsets) != header["count"] + 1:
+            raise ValueError(f"Docstore {prefix} is inconsistent: {len(self.offsets) - 1} offsets for {header['count']} records")
+
+        self._file = open(prefix + ".data", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return all(os.path.exists(prefix + suffix) for suffix in (".json", ".offsets.npy", ".data"))
+
+    @staticmethod
+    def write(prefix: str, records: Iterable[str], compression: Optional[str] = None) -> int:
+        """Write `records` to a new store at `prefix`, replacing any existing one; returns the count.
+
+        Each file is written under a temporary name and moved into place, header last,
+        so stores that are already open keep reading the old files.
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported docstore compression '{compression}', expected one of {COMPRESSIONS}")
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 8 bytes per record, so streamed corpora do not accumulate Python ints
+        offsets = array.array("Q", [0])
+        with open(prefix + ".data.tmp", "wb") as f:
+            for record in records:
+                payload = record.encode("utf-8")
+                if compression == "zlib":
+                    payload = zlib.compress(payload)
+                f.write(payload)
+                offsets.append(offsets[-1] + len(payload))
+        with open(prefix + ".offsets.npy.tmp", "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.uint64))
+        with open(prefix + ".json.tmp", "w") as f:
+            json.dump({"version": DOCSTORE_VERSION, "count": len(offsets) - 1, "compression": compression}, f)
+
+        for suffix in (".data", ".offsets.npy", ".json"):
+            os.replace(prefix + suffix + ".tmp", prefix + suffix)
+        return len(offsets) - 1
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row) -> str:
+        row = operator.index(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Docstore row {row} out of range for {len(self)} records")
+        payload = self._data[int(self.offsets[row]):int(self.offsets[row + 1])]
+        if self.compression == "zlib":
+            payload = zlib.decompress(payload)
+        return bytes(payload).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+        # Drop the memory-mapped offsets too; a closed store reads as empty
+        self.offsets = np.zeros(1, dtype=np.uint64)
+        self._data = b""
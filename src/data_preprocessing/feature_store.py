@@ -0,0 +1,150 @@
+# src/data_preprocessing/feature_store.py
+import json
+import os
+import struct
+import numpy as np
+import torch
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+MAGIC = b"MMRFEAT1"
+HEADER_ALIGN = 64
+FEATURE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+WRITE_CHUNK_ROWS = 65536
+
+
+def write_features(path: str, features, dtype: str = "float16") -> Dict[str, Any]:
+    """Write an (N, dim) feature matrix as a raw `dtype` array behind a small JSON header.
+
+    int8 uses symmetric scalar quantization with one scale for the whole matrix
+    (max |x| / 127), which suits L2-normalized features. The file is written under a
+    temporary name and moved into place, so processes mapping the old file are unaffected.
+    """
+    if dtype not in FEATURE_DTYPES:
+        raise ValueError(f"Unsupported feature dtype '{dtype}', expected one of {list(FEATURE_DTYPES)}")
+    if isinstance(features, torch.Tensor):
+        features = features.detach().cpu().numpy()
+    features = np.asarray(features, dtype=np.float32)
+    count, dim = features.shape
+
+    scale = 1.0
+    if dtype == "int8":
+        max_abs = float(np.abs(features).max()) if count else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+
+    chunks = (features[start:start + WRITE_CHUNK_ROWS] for start in range(0, count, WRITE_CHUNK_ROWS))
+    return _write_chunks(path, chunks, count, dim, dtype, scale)
+
+
+def concat_features(path: str, sources: List[str], dtype: str = "float16") -> Dict[str, Any]:
+    """Concatenate the rows of several feature files into one `dtype` file at `path`.
+
+    Sources are read chunk by chunk, so memory stays bounded by the chunk size rather
+    than the total row count. int8 output is requantized with one scale for all rows.
+    """
+    if dtype not in FEATURE_DTYPES:
+        raise ValueError(f"Unsupported feature dtype '{dtype}', expected one of {list(FEATURE_DTYPES)}")
+    headers = [read_header(source) for source in sources]
+    if not headers:
+        raise ValueError("No feature files to concatenate")
+    dims = {header["dim"] for header in headers}
+    if len(dims) != 1:
+        raise ValueError(f"Cannot concatenate feature files of different dimensions {sorted(dims)}")
+    count = sum(header["count"] for header in headers)
+
+    scale = 1.0
+    if dtype == "int8":
+        max_abs = 0.0
+        for features in _iter_chunks(sources):
+            max_abs = max(max_abs, float(np.abs(features).max()))
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+
+    return _write_chunks(path, _iter_chunks(sources), count, dims.pop(), dtype, scale)
+
+
+def _iter_chunks(sources: List[str]) -> Iterator[np.ndarray]:
+    for source in sources:
+        features = FeatureArray(source)
+        for start in range(0, len(features), WRITE_CHUNK_ROWS):
+            yield features[start:start + WRITE_CHUNK_ROWS]
+
+
+def _write_chunks(path: str, chunks: Iterable[np.ndarray], count: int, dim: int,
+                  dtype: str, scale: float) -> Dict[str, Any]:
+    header = json.dumps({"count": count, "dim": dim, "dtype": dtype, "scale": scale}).encode("utf-8")
+    prefix_len = len(MAGIC) + 4 + len(header)
+    data_offset = -(-prefix_len // HEADER_ALIGN) * HEADER_ALIGN
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(b"\0" * (data_offset - prefix_len))
+        for chunk in chunks:
+            if dtype == "int8":
+                chunk = np.clip(np.rint(chunk / scale), -127, 127)
+            f.write(np.ascontiguousarray(chunk, dtype=FEATURE_DTYPES[dtype]).tobytes())
+    os.replace(tmp_path, path)
+    return {"count": count, "dim": dim, "dtype": dtype, "scale": scale}
+
+
+def read_header(path: str) -> Optional[Dict[str, Any]]:
+    """Header of a feature file, or None if the file is not in this format."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    prefix_len = len(MAGIC) + 4 + header_len
+    header["offset"] = -(-prefix_len // HEADER_ALIGN) * HEADER_ALIGN
+    return header
+
+
+class FeatureArray:
+    """Read-only, memory-mapped feature matrix stored by `write_features`.
+
+    Indexing (`features[rows]`) reads and dequantizes only the requested rows to
+    float32: the re-ranker touches just its candidates and the indexers add rows one
+    chunk at a time. FAISS only accepts float32, so float16 / int8 rows are always
+    copied, but never the whole matrix at once. `np.asarray(features)` still yields
+    the full float32 matrix for callers that need it.
+    """
+
+    def __init__(self, path: str):
+        header = read_header(path)
+        if header is None:
+            raise ValueError(f"{path} is not a feature file")
+        self.path = path
+        self.count = header["count"]
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+        self.scale = header["scale"]
+        if self.count:
+            self.data = np.memmap(path, dtype=FEATURE_DTYPES[self.dtype], mode="r",
+                                  offset=header["offset"], shape=(self.count, self.dim))
+        else:
+            self.data = np.zeros((0, self.dim), dtype=FEATURE_DTYPES[self.dtype])
+
+    @property
+    def shape(self):
+        return (self.count, self.dim)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, rows) -> np.ndarray:
+        if isinstance(rows, torch.Tensor):
+            rows = rows.numpy()
+        return self._dequantize(self.data[rows])
+
+    def __array__(self, dtype=None, copy=None):
+        features = self._dequantize(self.data[:])
+        return features if dtype is None else features.astype(dtype, copy=False)
+
+    def _dequantize(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float32)
+        if self.dtype == "int8":
+            values *= self.scale
+        return values
@@ -1,16 +1,28 @@
 # src/data_preprocessing/preprocessor.py
+import logging
 import os
 import torch
 import json
 import pickle
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from tqdm import tqdm
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
-from src.encoding.image_encoder import encode_image
-from src.encoding.text_encoder import encode_text
+from src.encoding.image_encoder import encode_image, encode_images
+from src.encoding.text_encoder import encode_texts
+from src.data_preprocessing.cache_manifest import (
+    cache_key, data_digest, image_fingerprint, text_fingerprint, load_manifest, save_manifest
+)
+from src.data_preprocessing.docstore import DocStore
+from src.data_preprocessing.feature_store import FeatureArray, read_header, write_features
+from src.indexing.base_indexer import LazyIndex
 from src.indexing.faiss_lsh import build_faiss_lsh
 
+logger = logging.getLogger(__name__)
+
 
 class Preprocessor:
     def __init__(self, config: Dict[str, Any]):
@@ -18,113 +30,413 @@ class Preprocessor:
         self.cache_dir = config.get("cache_dir", "cache")
         self.max_token_length = config.get("max_token_length", 512)
         self.stride = config.get("stride", 256)
+        self.image_batch_size = config.get("image_batch_size", 32)
+        self.num_workers = config.get("num_workers", 4)
+        self.prefetch_batches = config.get("prefetch_batches", 2)
+        self.text_batch_size = config.get("text_batch_size", 64)
+        self.text_chunk_size = config.get("text_chunk_size", 4096)
+        # Record compression of the on-disk docstore (null or "zlib")
+        self.docstore_compression = config.get("docstore_compression")
+        # On-disk feature precision: float32, float16 or int8 (scalar-quantized)
+        self.feature_dtype = config.get("feature_dtype", "float16")
+
+    def process_data(self, data_config: Dict[str, Any], model, tokenizer, indexer_factory,
+                     lazy_indexes: Iterable[str] = ()) -> Dict[str, Any]:
+        """Process data and return features, paths, indices, etc.
 
-    def process_data(self, data_config: Dict[str, Any], model, tokenizer, indexer_factory) -> Dict[str, Any]:
-        """Process data and return features, paths, indices, etc."""
+        Items whose fingerprint is unchanged since the last run are reused from the
+        cache, new or modified items are encoded and removed items are dropped.
+        Indexes named in `lazy_indexes` ("image", "text") are built or loaded on first use.
+        """
         image_folder = data_config.get("image_folder", "data/images")
         text_jsonl = data_config.get("text_jsonl", "data/texts.jsonl")
         
         os.makedirs(self.cache_dir, exist_ok=True)
-        image_feat_path = os.path.join(self.cache_dir, "image_features.pt")
-        text_feat_path = os.path.join(self.cache_dir, "text_features.pt")
-        meta_path = os.path.join(self.cache_dir, "meta.pkl")
+        image_feat_path = os.path.join(self.cache_dir, "image_features.feat")
+        text_feat_path = os.path.join(self.cache_dir, "text_features.feat")
+        docstore_dir = os.path.join(self.cache_dir, "docstore")
+        manifest_path = os.path.join(self.cache_dir, "manifest.json")
 
-        if os.path.exists(image_feat_path) and os.path.exists(text_feat_path) and os.path.exists(meta_path):
-            print(f"🔁 Loading from local cache at {self.cache_dir}...")
-            image_features = torch.load(image_feat_path)
-            text_features = torch.load(text_feat_path)
-            with open(meta_path, "rb") as f:
-                meta = pickle.load(f)
-                
-            # Create indices
-            print("Building FAISS indices from cached features...")
-            image_index = indexer_factory.create_index(image_features)
-            text_index = indexer_factory.create_index(text_features)
-            
-            return {
-                "image_features": image_features,
-                "image_paths": meta["image_paths"],
-                "text_features": text_features,
-                "text_contents": meta["text_contents"],
-                "text_ids": meta["text_ids"],
-                "image_index": image_index,
-                "text_index": text_index
-            }
-
-        print(f"📦 Encoding image and text features, will cache to {self.cache_dir}...")
-        image_features, image_paths = self._process_images(image_folder, model)
-        text_features, text_contents, text_ids = self._process_texts(text_jsonl, model, tokenizer)
-
-        # Save to cache
-        os.makedirs(os.path.dirname(image_feat_path), exist_ok=True)
-        torch.save(image_features, image_feat_path)
-        torch.save(text_features, text_feat_path)
-        with open(meta_path, "wb") as f:
-            pickle.dump({
+        key = cache_key(self._model_name(model), self.max_token_length, self.stride)
+        cached = self._load_cache(image_feat_path, text_feat_path, docstore_dir, manifest_path, key)
+        if cached is None:
+            logger.info("📦 Encoding image and text features, will cache to %s...", self.cache_dir)
+        else:
+            logger.info("🔁 Updating local cache at %s...", self.cache_dir)
+
+        image_features, image_paths, image_fps, failed_images, images_changed = self._process_images(
+            image_folder, model, cached
+        )
+        text_features, text_contents, text_ids, text_fps, texts_changed = self._process_texts(
+            text_jsonl, model, tokenizer, cached
+        )
+
+        if cached is None or images_changed or texts_changed:
+            # Save to cache; the manifest goes last so a partial write is never trusted
+            if cached is None or images_changed:
+                write_features(image_feat_path, image_features, self.feature_dtype)
+            if cached is None or texts_changed:
+                write_features(text_feat_path, text_features, self.feature_dtype)
+            self._write_docstores(docstore_dir, {
                 "image_paths": image_paths,
                 "text_contents": text_contents,
                 "text_ids": text_ids
-            }, f)
+            })
+            save_manifest(manifest_path, key, image_fps, text_fps, failed_images)
+        if cached is not None:
+            self._close_docstores(cached)
+
+        # Serve features and metadata memory-mapped; the in-memory copies built above are released
+        docstores = self._open_docstores(docstore_dir)
+        image_features = FeatureArray(image_feat_path)
+        text_features = FeatureArray(text_feat_path)
 
-        # Create indices
-        print("Building FAISS indices from new features...")
-        image_index = indexer_factory.create_index(image_features)
-        text_index = indexer_factory.create_index(text_features)
+        # Load persisted indices or build them
+        image_index = self._open_index("image", image_features, data_digest(key, image_fps), indexer_factory, lazy_indexes)
+        text_index = self._open_index("text", text_features, data_digest(key, text_fps), indexer_factory, lazy_indexes)
         
         return {
             "image_features": image_features,
-            "image_paths": image_paths,
+            "image_paths": docstores["image_paths"],
             "text_features": text_features,
-            "text_contents": text_contents,
-            "text_ids": text_ids,
+            "text_contents": docstores["text_contents"],
+            "text_ids": docstores["text_ids"],
             "image_index": image_index,
             "text_index": text_index
         }
 
-    def _process_images(self, image_folder: str, model) -> Tuple[torch.Tensor, List[str]]:
-        """Process images and return features and paths."""
-        image_features = []
-        image_paths = []
-        
-        print(f"Processing images from: {image_folder}")
+    def _open_index(self, name: str, features, digest: str, indexer, lazy_indexes: Iterable[str]):
+        """The index for `name`, deferred to its first use if it is listed in `lazy_indexes`."""
+        if name in lazy_indexes:
+            return LazyIndex(lambda: self._load_or_build_index(name, features, digest, indexer), name)
+        return self._load_or_build_index(name, features, digest, indexer)
+
+    def _load_or_build_index(self, name: str, features: torch.Tensor, digest: str, indexer):
+        """Reuse the index persisted next to the feature cache, rebuilding it if anything changed."""
+        if not hasattr(indexer, "config_fingerprint"):
+            logger.info("Building FAISS %s index...", name)
+            return indexer.create_index(features)
+
+        index_path = os.path.join(self.cache_dir, f"{name}_index.faiss")
+        index_meta_path = os.path.join(self.cache_dir, f"{name}_index.json")
+        fingerprint = {"index": indexer.config_fingerprint(), "data": digest, "count": len(features)}
+
+        if os.path.exists(index_path) and os.path.exists(index_meta_path):
+            with open(index_meta_path, "r") as f:
+                cached_fingerprint = json.load(f)
+            if cached_fingerprint == fingerprint:
+                logger.info("🔁 Loading persisted %s index from %s...", name, index_path)
+                try:
+                    return indexer.load_index(index_path)
+                except Exception as e:
+                    logger.warning("Failed to load %s, rebuilding: %s", index_path, e)
+
+        logger.info("Building FAISS %s index...", name)
+        index = indexer.create_index(features)
+
+        # save_index replaces the persisted index atomically, so processes still mapping it are unaffected
+        indexer.save_index(index, index_path)
+        with open(index_meta_path, "w") as f:
+            json.dump(fingerprint, f)
+        return index
+
+    @staticmethod
+    def _model_name(model) -> str:
+        """Identify the encoder weights so that a model change invalidates the cache."""
+        name = getattr(model, "name_or_path", None)
+        if not name:
+            name = getattr(getattr(model, "config", None), "_name_or_path", "")
+        return name or type(model).__name__
+
+    DOCSTORE_FIELDS = ("image_paths", "text_contents", "text_ids")
+
+    def _write_docstores(self, docstore_dir: str, meta: Dict[str, List[str]]):
+        for field in self.DOCSTORE_FIELDS:
+            DocStore.write(os.path.join(docstore_dir, field), meta[field], self.docstore_compression)
+
+    def _open_docstores(self, docstore_dir: str) -> Dict[str, DocStore]:
+        return {field: DocStore(os.path.join(docstore_dir, field)) for field in self.DOCSTORE_FIELDS}
+
+    def _close_docstores(self, meta: Dict[str, Any]):
+        for field in self.DOCSTORE_FIELDS:
+            meta[field].close()
+
+    def _migrate_meta_pickle(self, docstore_dir: str):
+        """Convert the `meta.pkl` written by older versions into docstores, then remove it."""
+        meta_path = os.path.join(self.cache_dir, "meta.pkl")
+        if not os.path.exists(meta_path):
+            return
+        if not all(DocStore.exists(os.path.join(docstore_dir, field)) for field in self.DOCSTORE_FIELDS):
+            logger.info("Migrating %s to docstore at %s...", meta_path, docstore_dir)
+            with open(meta_path, "rb") as f:
+                self._write_docstores(docstore_dir, pickle.load(f))
+        os.remove(meta_path)
+
+    def _prepare_feature_file(self, path: str):
+        """Convert a legacy `.pt` cache or a file stored with another dtype to `feature_dtype`."""
+        legacy_path = os.path.splitext(path)[0] + ".pt"
+        if os.path.exists(legacy_path):
+            if not os.path.exists(path):
+                logger.info("Migrating %s to %s feature file %s...", legacy_path, self.feature_dtype, path)
+                write_features(path, torch.load(legacy_path), self.feature_dtype)
+            os.remove(legacy_path)
+            return
+
+        if not os.path.exists(path):
+            return
+        header = read_header(path)
+        if header is not None and header["dtype"] != self.feature_dtype:
+            if header["dtype"] == "int8":
+                logger.warning("Converting int8 features in %s to %s keeps the int8 error; "
+                               "delete the cache to re-encode at full precision.", path, self.feature_dtype)
+            logger.info("Converting %s from %s to %s...", path, header["dtype"], self.feature_dtype)
+            write_features(path, FeatureArray(path), self.feature_dtype)
+
+    def _load_cache(self, image_feat_path: str, text_feat_path: str, docstore_dir: str,
+                    manifest_path: str, key: str) -> Optional[Dict[str, Any]]:
+        """Load cached features and metadata if a manifest built with the same settings exists."""
+        self._migrate_meta_pickle(docstore_dir)
+        self._prepare_feature_file(image_feat_path)
+        self._prepare_feature_file(text_feat_path)
+        docstore_exists = all(DocStore.exists(os.path.join(docstore_dir, field)) for field in self.DOCSTORE_FIELDS)
+        if not (os.path.exists(image_feat_path) and os.path.exists(text_feat_path) and docstore_exists):
+            return None
+
+        manifest = load_manifest(manifest_path, key)
+        if manifest is None:
+            return None
+
+        image_features = FeatureArray(image_feat_path)
+        text_features = FeatureArray(text_feat_path)
+        meta = self._open_docstores(docstore_dir)
+
+        if len(manifest["images"]) != len(meta["image_paths"]) or len(manifest["texts"]) != len(meta["text_ids"]):
+            logger.warning("Cache manifest does not match cached metadata, re-encoding.")
+            self._close_docstores(meta)
+            return None
+
+        return {
+            "image_features": image_features,
+            "image_paths": meta["image_paths"],
+            "image_fingerprints": manifest["images"],
+            "failed_images": manifest.get("failed_images", {}),
+            "text_features": text_features,
+            "text_contents": meta["text_contents"],
+            "text_ids": meta["text_ids"],
+            "text_fingerprints": manifest["texts"]
+        }
+
+    def _process_images(self, image_folder: str, model, cached: Optional[Dict[str, Any]] = None):
+        """Process images and return features, paths, fingerprints, failed images and whether anything changed.
+
+        Images that failed to decode or encode are recorded with their fingerprint and
+        skipped until the file changes, so they do not force a cache rewrite on every run.
+        """
+        logger.info("Processing images from: %s", image_folder)
         if not os.path.exists(image_folder):
             raise FileNotFoundError(f"Image folder not found: {image_folder}")
-            
-        for fname in tqdm(os.listdir(image_folder), desc="Encoding Images"):
+
+        paths = []
+        fingerprints = {}
+        for fname in os.listdir(image_folder):
             if fname.lower().endswith((".jpg", ".jpeg", ".png")):
                 path = os.path.join(image_folder, fname)
                 try:
-                    image = Image.open(path).convert("RGB")
-                    image_feat = encode_image(model, image)
-                    image_features.append(image_feat)
-                    image_paths.append(path)
-                except Exception as e:
-                    print(f"Skipping image {path}: {e}")
+                    fingerprints[path] = image_fingerprint(path)
+                    paths.append(path)
+                except OSError as e:
+                    logger.warning("Skipping image %s: %s", path, e)
+
+        cached_rows = {}
+        cached_failed = {}
+        if cached is not None:
+            for row, (path, fp) in enumerate(zip(cached["image_paths"], cached["image_fingerprints"])):
+                cached_rows[path] = (row, fp)
+            cached_failed = cached["failed_images"]
+
+        reused_rows = []
+        reused_paths = []
+        to_encode = []
+        failed = {}
+        for path in paths:
+            hit = cached_rows.get(path)
+            if cached_failed.get(path) == fingerprints[path]:
+                failed[path] = fingerprints[path]
+            elif hit is not None and hit[1] == fingerprints[path]:
+                reused_rows.append(hit[0])
+                reused_paths.append(path)
+            else:
+                to_encode.append(path)
+
+        if (not to_encode and cached is not None and failed == cached_failed
+                and reused_rows == list(range(len(cached["image_features"])))):
+            # Nothing changed: keep serving the memory-mapped cache
+            logger.info("Images: %d reused, 0 encoded, 0 removed or changed, %d unreadable skipped",
+                        len(reused_paths), len(failed))
+            return cached["image_features"], reused_paths, [fingerprints[p] for p in reused_paths], failed, False
+
+        image_features = []
+        if reused_rows:
+            image_features.append(self._cached_rows(cached["image_features"], reused_rows))
+        new_features, new_paths = self._encode_image_paths(to_encode, model)
+        image_features.extend(new_features)
+        encoded = set(new_paths)
+        failed.update((path, fingerprints[path]) for path in to_encode if path not in encoded)
 
         if not image_features:
             raise ValueError(f"No valid images found in {image_folder}")
-            
-        return torch.cat(image_features, dim=0), image_paths
 
-    def _process_texts(self, text_jsonl: str, model, tokenizer) -> Tuple[torch.Tensor, List[str], List[str]]:
-        """Process texts and return features, contents, and IDs."""
-        text_features = []
-        text_contents = []
-        text_ids = []
-        
-        print(f"Processing texts from: {text_jsonl}")
+        # Put reused and new rows back in listing order, so that the next run finds the
+        # cache rows 0..n-1 in place instead of rewriting it again
+        positions = {path: i for i, path in enumerate(reused_paths + new_paths)}
+        image_paths = [path for path in paths if path in positions]
+
+        removed = len(cached_rows) - len(reused_rows)
+        logger.info("Images: %d reused, %d encoded, %d removed or changed, %d unreadable skipped",
+                    len(reused_paths), len(new_paths), removed, len(failed))
+        # A reordered listing also counts: the cached docstore rows must match the feature rows
+        changed = (bool(to_encode) or removed > 0 or failed != cached_failed
+                   or reused_rows != list(range(len(reused_rows))))
+        image_features = self._in_source_order(image_features, [positions[path] for path in image_paths])
+        return image_features, image_paths, [fingerprints[p] for p in image_paths], failed, changed
+
+    def _encode_image_paths(self, paths: List[str], model) -> Tuple[List[torch.Tensor], List[str]]:
+        """Encode images batch by batch while a thread pool decodes the following batches."""
+        image_features = []
+        image_paths = []
+        batches = [paths[i:i + self.image_batch_size] for i in range(0, len(paths), self.image_batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            pending = deque()
+            next_batch = 0
+            with tqdm(total=len(paths), desc="Encoding Images") as progress:
+                while next_batch < len(batches) or pending:
+                    # Keep up to `prefetch_batches` batches decoding ahead of the model
+                    while next_batch < len(batches) and len(pending) <= self.prefetch_batches:
+                        batch = batches[next_batch]
+                        pending.append((batch, [executor.submit(self._load_image, path) for path in batch]))
+                        next_batch += 1
+
+                    batch, futures = pending.popleft()
+                    loaded = [(path, future.result()) for path, future in zip(batch, futures)]
+                    loaded = [(path, image) for path, image in loaded if image is not None]
+                    if loaded:
+                        feats, ok_paths = self._encode_image_batch(loaded, model)
+                        if ok_paths:
+                            image_features.append(feats)
+                            image_paths.extend(ok_paths)
+                    progress.update(len(batch))
+
+        return image_features, image_paths
+
+    @staticmethod
+    def _load_image(path: str) -> Optional[Image.Image]:
+        """Decode a single image, returning None for unreadable files."""
+        try:
+            return Image.open(path).convert("RGB")
+        except Exception as e:
+            logger.warning("Skipping image %s: %s", path, e)
+            return None
+
+    def _encode_image_batch(self, loaded: List[Tuple[str, Image.Image]], model) -> Tuple[Optional[torch.Tensor], List[str]]:
+        """Encode a decoded batch in one forward pass, falling back to per-image encoding on failure."""
+        try:
+            return encode_images(model, [image for _, image in loaded]), [path for path, _ in loaded]
+        except Exception as e:
+            logger.warning("Batch encoding failed (%s), retrying %d images one by one", e, len(loaded))
+
+        feats = []
+        ok_paths = []
+        for path, image in loaded:
+            try:
+                feats.append(encode_image(model, image))
+                ok_paths.append(path)
+            except Exception as e:
+                logger.warning("Skipping image %s: %s", path, e)
+        if not feats:
+            return None, []
+        return torch.cat(feats, dim=0), ok_paths
+
+    def _process_texts(self, text_jsonl: str, model, tokenizer, cached: Optional[Dict[str, Any]] = None):
+        """Process texts and return features, contents, IDs, fingerprints and whether anything changed."""
+        logger.info("Processing texts from: %s", text_jsonl)
         if not os.path.exists(text_jsonl):
             raise FileNotFoundError(f"Text JSONL file not found: {text_jsonl}")
-            
+
+        cached_rows: Dict[str, List[int]] = {}
+        if cached is not None:
+            for row, fp in enumerate(cached["text_fingerprints"]):
+                cached_rows.setdefault(fp, []).append(row)
+
+        reused_rows = []
+        reused = ([], [], [])
+        to_encode = ([], [], [])
+        # (reused?, index into reused / to_encode) of each record, in file order
+        order: List[Tuple[bool, int]] = []
+        # Duplicate records take the cached rows of their fingerprint in order, so an
+        # unchanged file reuses exactly rows 0..n-1; extra duplicates share the first row
+        taken: Dict[str, int] = {}
         with open(text_jsonl, 'r') as f:
-            for line in tqdm(f, desc="Encoding Texts"):
+            for line in f:
                 obj = json.loads(line)
-                text_feat = encode_text(model, tokenizer, obj["contents"], self.max_token_length, self.stride)
-                text_features.append(text_feat)
-                text_contents.append(obj["contents"])
-                text_ids.append(obj["id"])
+                fp = text_fingerprint(obj)
+                rows = cached_rows.get(fp)
+                if rows is not None:
+                    count = taken.get(fp, 0)
+                    reused_rows.append(rows[count] if count < len(rows) else rows[0])
+                    taken[fp] = count + 1
+                    target = reused
+                else:
+                    target = to_encode
+                order.append((target is reused, len(target[0])))
+                target[0].append(obj["contents"])
+                target[1].append(obj["id"])
+                target[2].append(fp)
 
-        if not text_features:
+        if not reused_rows and not to_encode[0]:
             raise ValueError(f"No valid texts found in {text_jsonl}")
-            
-        return torch.cat(text_features, dim=0), text_contents, text_ids
\ No newline at end of file
+
+        if not to_encode[0] and cached is not None and reused_rows == list(range(len(cached["text_features"]))):
+            # Nothing changed: keep serving the memory-mapped cache
+            logger.info("Texts: %d reused, 0 encoded, 0 removed or changed", len(reused_rows))
+            return cached["text_features"], reused[0], reused[1], reused[2], False
+
+        text_features = []
+        if reused_rows:
+            text_features.append(self._cached_rows(cached["text_features"], reused_rows))
+        if to_encode[0]:
+            text_features.append(self._encode_text_contents(to_encode[0], model, tokenizer))
+
+        removed = sum(len(rows) - min(taken.get(fp, 0), len(rows)) for fp, rows in cached_rows.items())
+        logger.info("Texts: %d reused, %d encoded, %d removed or changed", len(reused_rows), len(to_encode[0]), removed)
+        changed = bool(to_encode[0]) or removed > 0 or reused_rows != list(range(len(reused_rows)))
+        # Rows stay in file order (see _process_images)
+        positions = [i if was_reused else len(reused_rows) + i for was_reused, i in order]
+        fields = [[(reused if was_reused else to_encode)[field][i] for was_reused, i in order] for field in range(3)]
+        return self._in_source_order(text_features, positions), fields[0], fields[1], fields[2], changed
+
+    @staticmethod
+    def _in_source_order(features: List[torch.Tensor], positions: List[int]) -> torch.Tensor:
+        """Concatenate reused and newly encoded rows, then reorder them to `positions`
+        (the row of the concatenation that goes to each output row)."""
+        features = torch.cat(features, dim=0)
+        if positions == list(range(len(features))):
+            return features
+        return features[torch.as_tensor(positions, dtype=torch.long)]
+
+    @staticmethod
+    def _cached_rows(features: FeatureArray, rows: List[int]) -> torch.Tensor:
+        """Dequantized float32 copy of the given cached rows."""
+        return torch.from_numpy(np.ascontiguousarray(features[np.asarray(rows, dtype=np.int64)]))
+
+    def _encode_text_contents(self, text_contents: List[str], model, tokenizer) -> torch.Tensor:
+        """Encode documents chunk by chunk with length-bucketed window batches."""
+        text_features = []
+        with tqdm(total=len(text_contents), desc="Encoding Texts") as progress:
+            for start in range(0, len(text_contents), self.text_chunk_size):
+                chunk = text_contents[start:start + self.text_chunk_size]
+                text_features.append(encode_texts(
+                    model, tokenizer, chunk, self.max_token_length, self.stride, self.text_batch_size
+                ))
+                progress.update(len(chunk))
+        return torch.cat(text_features, dim=0)
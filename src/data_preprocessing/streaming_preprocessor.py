@@ -0,0 +1,304 @@
+# src/data_preprocessing/streaming_preprocessor.py
+import logging
+import os
+import re
+import json
+import hashlib
+import shutil
+import torch
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from src.data_preprocessing.cache_manifest import (
+    cache_key, data_digest, image_fingerprint, text_fingerprint, save_manifest
+)
+from src.data_preprocessing.docstore import DocStore
+from src.data_preprocessing.feature_store import FeatureArray, concat_features, read_header, write_features
+from src.data_preprocessing.preprocessor import Preprocessor
+
+logger = logging.getLogger(__name__)
+
+INGEST_VERSION = 2
+SHARD_NAME = re.compile(r"(shard_[0-9a-f]+)\.")
+
+
+class StreamingPreprocessor(Preprocessor):
+    """Ingests the corpus in shards that are checkpointed to disk.
+
+    The image listing and the JSONL file are read as streams and cut into groups of
+    about `shard_size` source items. Each group is encoded, written under
+    `<cache_dir>/ingest/` as a shard (features, rows and finally a marker with the
+    source fingerprints) and released, so memory is bounded by one shard (at most
+    2 * shard_size items) instead of the corpus.
+
+    Group boundaries are content-defined: a group ends after an item whose fingerprint
+    hash hits 1 in `shard_size`, and shards are named after the digest of their
+    sources. Inserting, deleting or editing records therefore re-encodes only the
+    shards they fall into; the following groups keep their boundaries and are reused.
+    An interrupted run resumes after the last complete shard. The shards are then
+    concatenated into the same feature files, docstores and manifest that the
+    standard preprocessor writes.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        # Average source items (images or JSONL lines) per checkpointed shard
+        self.shard_size = config.get("shard_size", 10000)
+        # Bounds on the content-defined group sizes
+        self.min_shard_items = max(1, self.shard_size // 4)
+        self.max_shard_items = max(1, self.shard_size * 2)
+        # int8 needs one scale for the whole corpus, so shards keep float16 and are quantized when concatenated
+        self.shard_dtype = "float32" if self.feature_dtype == "float32" else "float16"
+
+    def process_data(self, data_config: Dict[str, Any], model, tokenizer, indexer_factory,
+                     lazy_indexes: Iterable[str] = ()) -> Dict[str, Any]:
+        """Process data shard by shard and return features, paths, indices, etc."""
+        image_folder = data_config.get("image_folder", "data/images")
+        text_jsonl = data_config.get("text_jsonl", "data/texts.jsonl")
+        if not os.path.exists(image_folder):
+            raise FileNotFoundError(f"Image folder not found: {image_folder}")
+        if not os.path.exists(text_jsonl):
+            raise FileNotFoundError(f"Text JSONL file not found: {text_jsonl}")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        image_feat_path = os.path.join(self.cache_dir, "image_features.feat")
+        text_feat_path = os.path.join(self.cache_dir, "text_features.feat")
+        docstore_dir = os.path.join(self.cache_dir, "docstore")
+        manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        ingest_dir = os.path.join(self.cache_dir, "ingest")
+
+        key = cache_key(self._model_name(model), self.max_token_length, self.stride)
+        state = self._load_state(ingest_dir, {
+            "version": INGEST_VERSION,
+            "cache_key": key,
+            "shard_size": self.shard_size,
+            "shard_dtype": self.shard_dtype
+        })
+        logger.info("📦 Streaming ingestion into %s (%d items per shard)...", ingest_dir, self.shard_size)
+
+        logger.info("Processing images from: %s", image_folder)
+        image_shards = self._ingest(
+            os.path.join(ingest_dir, "images"), self._iter_images(image_folder),
+            lambda group: self._encode_image_group(group, model), "Images"
+        )
+        if not sum(shard["count"] for shard in image_shards):
+            raise ValueError(f"No valid images found in {image_folder}")
+
+        logger.info("Processing texts from: %s", text_jsonl)
+        text_shards = self._ingest(
+            os.path.join(ingest_dir, "texts"), self._iter_texts(text_jsonl),
+            lambda group: self._encode_text_group(group, model, tokenizer), "Texts"
+        )
+        if not sum(shard["count"] for shard in text_shards):
+            raise ValueError(f"No valid texts found in {text_jsonl}")
+
+        # The outputs are current if they were last built from exactly these shards
+        consolidated = {
+            "feature_dtype": self.feature_dtype,
+            "docstore_compression": self.docstore_compression,
+            "images": [shard["digest"] for shard in image_shards],
+            "texts": [shard["digest"] for shard in text_shards]
+        }
+        outputs_exist = (
+            os.path.exists(image_feat_path) and os.path.exists(text_feat_path) and os.path.exists(manifest_path)
+            and all(DocStore.exists(os.path.join(docstore_dir, field)) for field in self.DOCSTORE_FIELDS)
+        )
+        if state["consolidated"] != consolidated or not outputs_exist:
+            logger.info("Concatenating %d image and %d text shards into %s...", len(image_shards), len(text_shards), self.cache_dir)
+            concat_features(image_feat_path, self._shard_feature_paths(image_shards), self.feature_dtype)
+            concat_features(text_feat_path, self._shard_feature_paths(text_shards), self.feature_dtype)
+            self._write_docstores(docstore_dir, {
+                "image_paths": self._iter_rows(image_shards, "path"),
+                "text_contents": self._iter_rows(text_shards, "contents"),
+                "text_ids": self._iter_rows(text_shards, "id")
+            })
+            # The manifest goes last so a partial write is never trusted
+            save_manifest(manifest_path, key, self._iter_fingerprints(image_shards), self._iter_fingerprints(text_shards))
+            state["consolidated"] = consolidated
+            self._save_state(ingest_dir, state)
+
+        docstores = self._open_docstores(docstore_dir)
+        image_features = FeatureArray(image_feat_path)
+        text_features = FeatureArray(text_feat_path)
+
+        # Load persisted indices or build them
+        image_index = self._open_index(
+            "image", image_features, data_digest(key, self._iter_fingerprints(image_shards)), indexer_factory, lazy_indexes
+        )
+        text_index = self._open_index(
+            "text", text_features, data_digest(key, self._iter_fingerprints(text_shards)), indexer_factory, lazy_indexes
+        )
+
+        return {
+            "image_features": image_features,
+            "image_paths": docstores["image_paths"],
+            "text_features": text_features,
+            "text_contents": docstores["text_contents"],
+            "text_ids": docstores["text_ids"],
+            "image_index": image_index,
+            "text_index": text_index
+        }
+
+    def _load_state(self, ingest_dir: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the ingestion state, discarding all shards if they were built with other settings."""
+        state_path = os.path.join(ingest_dir, "state.json")
+        state = None
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, "r") as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable ingestion state %s: %s", state_path, e)
+
+        if state is None or state.get("settings") != settings:
+            if os.path.exists(ingest_dir):
+                logger.warning("Shards in %s were built with other settings, re-encoding.", ingest_dir)
+                shutil.rmtree(ingest_dir)
+            state = {"settings": settings, "consolidated": None}
+            self._save_state(ingest_dir, state)
+        return state
+
+    @staticmethod
+    def _save_state(ingest_dir: str, state: Dict[str, Any]):
+        os.makedirs(ingest_dir, exist_ok=True)
+        state_path = os.path.join(ingest_dir, "state.json")
+        with open(state_path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(state_path + ".tmp", state_path)
+
+    def _ingest(self, shard_dir: str, source: Iterator[Tuple[Any, Any]],
+                encode_group: Callable, label: str) -> List[Dict[str, Any]]:
+        """Cut `source` into shards, reusing complete shards whose source fingerprints are unchanged.
+
+        `source` yields (fingerprint, item) pairs; `encode_group` turns a list of them into
+        (features, rows, row fingerprints). Returns the prefix, digest and row count of each shard.
+        """
+        os.makedirs(shard_dir, exist_ok=True)
+        shards = []
+        reused = 0
+        for group in self._groups(source):
+            sources = [fingerprint for fingerprint, _ in group]
+            digest = data_digest("shard", sources)
+            prefix = os.path.join(shard_dir, f"shard_{digest[:20]}")
+            marker = self._read_marker(prefix)
+            if marker is not None and marker["sources"] == sources:
+                reused += 1
+            else:
+                marker = self._write_shard(prefix, digest, sources, *encode_group(group))
+            shards.append({"prefix": prefix, "digest": marker["digest"], "count": marker["count"]})
+
+        self._remove_shards(shard_dir, {os.path.basename(shard["prefix"]) for shard in shards})
+        logger.info("%s: %d shards reused, %d encoded", label, reused, len(shards) - reused)
+        return shards
+
+    def _groups(self, source: Iterator[Tuple[Any, Any]]) -> Iterator[List[Tuple[Any, Any]]]:
+        """Split `source` at content-defined boundaries, so that an inserted or deleted item
+        only changes the group it falls into."""
+        group = []
+        for fingerprint, item in source:
+            group.append((fingerprint, item))
+            if len(group) >= self.max_shard_items or (
+                    len(group) >= self.min_shard_items and self._is_boundary(fingerprint)):
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def _is_boundary(self, fingerprint: Any) -> bool:
+        payload = json.dumps(fingerprint).encode("utf-8")
+        return int(hashlib.sha1(payload).hexdigest()[:8], 16) % self.shard_size == 0
+
+    def _write_shard(self, prefix: str, digest: str, sources: List[Any], features: Optional[torch.Tensor],
+                     rows: List[Dict[str, Any]], fingerprints: List[Any]) -> Dict[str, Any]:
+        """Write one shard; the marker goes last, so a shard without one is never trusted."""
+        marker_path = prefix + ".json"
+        if os.path.exists(marker_path):
+            os.remove(marker_path)
+
+        if rows:
+            write_features(prefix + ".feat", features, self.shard_dtype)
+        with open(prefix + ".rows.jsonl.tmp", "w") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(prefix + ".rows.jsonl.tmp", prefix + ".rows.jsonl")
+
+        marker = {
+            "version": INGEST_VERSION,
+            "digest": digest,
+            "count": len(rows),
+            "sources": sources,
+            "fingerprints": fingerprints
+        }
+        with open(marker_path + ".tmp", "w") as f:
+            json.dump(marker, f)
+        os.replace(marker_path + ".tmp", marker_path)
+        return marker
+
+    @staticmethod
+    def _read_marker(prefix: str) -> Optional[Dict[str, Any]]:
+        """Marker of a complete shard at `prefix`, or None if the shard is missing or partial."""
+        try:
+            with open(prefix + ".json", "r") as f:
+                marker = json.load(f)
+            if marker.get("version") != INGEST_VERSION or not os.path.exists(prefix + ".rows.jsonl"):
+                return None
+            if marker["count"] and read_header(prefix + ".feat")["count"] != marker["count"]:
+                return None
+            return marker
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _remove_shards(shard_dir: str, keep: set):
+        """Delete shards not in `keep`, left over from groups that changed or disappeared."""
+        for fname in os.listdir(shard_dir):
+            match = SHARD_NAME.match(fname)
+            if match and match.group(1) not in keep:
+                os.remove(os.path.join(shard_dir, fname))
+
+    @staticmethod
+    def _iter_images(image_folder: str) -> Iterator[Tuple[List[Any], str]]:
+        with os.scandir(image_folder) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith((".jpg", ".jpeg", ".png")):
+                    try:
+                        fingerprint = image_fingerprint(entry.path)
+                    except OSError as e:
+                        logger.warning("Skipping image %s: %s", entry.path, e)
+                        continue
+                    # The path is part of the source fingerprint: rows record it
+                    yield [entry.path] + fingerprint, entry.path
+
+    @staticmethod
+    def _iter_texts(text_jsonl: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with open(text_jsonl, "r") as f:
+            for line in f:
+                obj = json.loads(line)
+                yield text_fingerprint(obj), obj
+
+    def _encode_image_group(self, group: List[Tuple[List[Any], str]], model):
+        fingerprints = {path: source[1:] for source, path in group}
+        feats, paths = self._encode_image_paths([path for _, path in group], model)
+        features = torch.cat(feats, dim=0) if feats else None
+        return features, [{"path": path} for path in paths], [fingerprints[path] for path in paths]
+
+    def _encode_text_group(self, group: List[Tuple[str, Dict[str, Any]]], model, tokenizer):
+        features = self._encode_text_contents([obj["contents"] for _, obj in group], model, tokenizer)
+        rows = [{"contents": obj["contents"], "id": obj["id"]} for _, obj in group]
+        return features, rows, [fingerprint for fingerprint, _ in group]
+
+    @staticmethod
+    def _shard_feature_paths(shards: List[Dict[str, Any]]) -> List[str]:
+        return [shard["prefix"] + ".feat" for shard in shards if shard["count"]]
+
+    @staticmethod
+    def _iter_rows(shards: List[Dict[str, Any]], field: str) -> Iterator[Any]:
+        for shard in shards:
+            with open(shard["prefix"] + ".rows.jsonl", "r") as f:
+                for line in f:
+                    yield json.loads(line)[field]
+
+    @staticmethod
+    def _iter_fingerprints(shards: List[Dict[str, Any]]) -> Iterator[Any]:
+        for shard in shards:
+            with open(shard["prefix"] + ".json", "r") as f:
+                yield from json.load(f)["fingerprints"]
@@ -0,0 +1,71 @@
+# src/deadline.py
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+from src import metrics
+
+
+class Deadline:
+    """Per-request time budget passed through the pipeline stages.
+
+    Stages consult the remaining budget to decide how much work they can afford
+    (fewer text windows, smaller ANN search effort, shorter generation) and record
+    every degradation they apply so it can be reported with the result.
+    """
+
+    def __init__(self, budget_ms: float):
+        self.budget = max(0.0, budget_ms / 1000.0)
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget
+        self._degradations: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_input(cls, input_data: Dict[str, Any], default_ms: Optional[float] = None) -> Optional["Deadline"]:
+        """Deadline of a request: a `deadline` object, else `deadline_ms`, else `default_ms`."""
+        deadline = input_data.get("deadline")
+        if isinstance(deadline, Deadline):
+            return deadline
+        budget_ms = input_data.get("deadline_ms", default_ms)
+        if budget_ms is None:
+            return None
+        return cls(float(budget_ms))
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000.0
+
+    def fraction_remaining(self) -> float:
+        """Share of the budget still available, in [0, 1]."""
+        if self.budget <= 0:
+            return 0.0
+        return min(1.0, self.remaining() / self.budget)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def record(self, stage: str, action: str, **details):
+        """Note a degradation applied by `stage` because of this deadline."""
+        entry = {"stage": stage, "action": action, "remaining_ms": round(self.remaining_ms(), 1)}
+        entry.update(details)
+        with self._lock:
+            self._degradations.append(entry)
+        metrics.DEGRADATIONS.inc(stage=stage, action=action)
+
+    @property
+    def degradations(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._degradations)
+
+
+def tightest(deadlines: Iterable[Optional[Deadline]]) -> Optional[Deadline]:
+    """The deadline with the least time left, ignoring requests without one."""
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    if not deadlines:
+        return None
+    return min(deadlines, key=lambda deadline: deadline.expires_at)
@@ -0,0 +1,80 @@
+# src/encoding/embedding_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional
+
+import numpy as np
+from PIL import Image
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different spellings of a query share an entry."""
+    return " ".join(text.split())
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of the decoded pixels, independent of file name or encoding."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    digest = hashlib.sha1(f"{image.size[0]}x{image.size[1]}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of query embeddings, bounded by entry count and bytes."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.max_entries = config.get("max_entries", 10000)
+        self.max_bytes = config.get("max_bytes", 256 * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def text_key(text: str, max_token_length: int, stride: int) -> Hashable:
+        return ("text", normalize_text(text), max_token_length, stride)
+
+    @staticmethod
+    def image_key(image: Image.Image) -> Hashable:
+        return ("image", image_digest(image))
+
+    @staticmethod
+    def joint_key(image: Image.Image, text: str, max_token_length: int, stride: int, combine_method: str) -> Hashable:
+        return ("joint", image_digest(image), normalize_text(text), max_token_length, stride, combine_method)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = value
+            self._bytes += value.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
@@ -1,9 +1,19 @@
 # src/encoding/image_encoder.py
 import torch
 from PIL import Image
+from typing import List
+
+from src import metrics
 
 def encode_image(model, image: Image.Image):
-    with torch.no_grad():
+    with torch.no_grad(), metrics.stage("encode_image"):
         feat = model.encode(images=image)
         feat = feat / feat.norm(dim=-1, keepdim=True)
-    return feat.cpu()
\ No newline at end of file
+    return feat.cpu()
+
+def encode_images(model, images: List[Image.Image]):
+    """Encode a batch of images with a single forward pass."""
+    with torch.no_grad(), metrics.stage("encode_image"):
+        feats = model.encode(images=images)
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+    return feats.cpu()
@@ -1,11 +1,14 @@
 # src/encoding/joint_encoder.py
+import logging
 import numpy as np
 import torch
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence, Union
 from PIL import Image
 
-from .image_encoder import encode_image
-from .text_encoder import encode_text
+from .image_encoder import encode_image, encode_images
+from .text_encoder import encode_text, encode_texts
+
+logger = logging.getLogger(__name__)
 
 class JointEncoder:
     def __init__(self, config: Dict[str, Any]):
@@ -14,7 +17,7 @@ class JointEncoder:
     
     def encode(self, model, tokenizer, image: Image.Image, text: str, max_token_length: int, stride: int):
         """Encode both image and text to create a joint representation."""
-        print(f"Joint encoding image and text using '{self.combine_method}' method...")
+        logger.debug("Joint encoding image and text using '%s' method...", self.combine_method)
         image_feat = encode_image(model, image)
         text_feat = encode_text(model, tokenizer, text, max_token_length, stride)
         
@@ -24,10 +27,10 @@ class JointEncoder:
         elif self.combine_method == "concat":
             # In this case we would need to project back to the original dimension
             # For simplicity, we'll still use average if the method is concat
-            print("Warning: Concat method not fully implemented, using average instead.")
+            logger.warning("Concat method not fully implemented, using average instead.")
             joint_feat = (image_feat + text_feat) / 2
         else:
-            print(f"Warning: Unknown combine method '{self.combine_method}', falling back to average.")
+            logger.warning("Unknown combine method '%s', falling back to average.", self.combine_method)
             joint_feat = (image_feat + text_feat) / 2
             
         # Normalize the joint feature
@@ -35,6 +38,25 @@ class JointEncoder:
         
         return joint_feat
 
+    def encode_batch(self, model, tokenizer, images: List[Image.Image], texts: List[str],
+                     max_token_length: int, stride: int, batch_size: int = 64,
+                     max_windows: Union[Optional[int], Sequence[Optional[int]]] = None,
+                     window_counts: Optional[List[int]] = None, encode_seconds: Optional[List[float]] = None):
+        """Encode paired images and texts, one batched forward pass per modality.
+
+        `max_windows`, `window_counts` and `encode_seconds` apply to the texts (see `encode_texts`).
+        """
+        image_feats = encode_images(model, images)
+        text_feats = encode_texts(
+            model, tokenizer, texts, max_token_length, stride, batch_size,
+            max_windows=max_windows, window_counts=window_counts, encode_seconds=encode_seconds
+        )
+
+        if self.combine_method not in ("average", "concat"):
+            logger.warning("Unknown combine method '%s', falling back to average.", self.combine_method)
+        joint_feats = (image_feats + text_feats) / 2
+        return joint_feats / joint_feats.norm(dim=-1, keepdim=True)
+
 # Legacy function for backward compatibility
 def encode_image_text(model, tokenizer, image, text, max_token_length, stride):
     """Legacy function for backward compatibility."""
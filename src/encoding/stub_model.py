@@ -0,0 +1,74 @@
+# src/encoding/stub_model.py
+import zlib
+import torch
+from PIL import Image
+from typing import Dict, Any, List, Union
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with hashed ids, mirroring the parts of the HF tokenizer API we use."""
+
+    pad_token_id = 0
+    bos_token_id = 1
+    eos_token_id = 2
+
+    def __init__(self, vocab_size: int = 30522):
+        self.vocab_size = vocab_size
+
+    def _ids(self, text: str) -> List[int]:
+        words = [zlib.crc32(word.lower().encode("utf-8")) % (self.vocab_size - 3) + 3 for word in text.split()]
+        return [self.bos_token_id] + words + [self.eos_token_id]
+
+    def __call__(self, text: Union[str, List[str]], return_tensors=None, truncation=False,
+                 padding=False, max_length=None, **kwargs) -> Dict[str, Any]:
+        if isinstance(text, list):
+            return {"input_ids": [self._ids(t) for t in text]}
+        input_ids = self._ids(text)
+        if truncation and max_length:
+            input_ids = input_ids[:max_length]
+        if return_tensors is None:
+            return {"input_ids": input_ids}
+        return {
+            "input_ids": torch.tensor([input_ids], dtype=torch.long),
+            "attention_mask": torch.ones(1, len(input_ids), dtype=torch.long)
+        }
+
+
+class StubModel:
+    """Deterministic CPU stand-in for the BGE-VL model, for local testing and benchmarks.
+
+    Text features are the mean of fixed random token embeddings; image features are a
+    fixed random projection of a 16x16 grayscale thumbnail. Shared words therefore give
+    similar text embeddings, and identical images identical embeddings, without any
+    weights to download.
+    """
+
+    name_or_path = "stub"
+
+    def __init__(self, dim: int = 512, vocab_size: int = 30522, seed: int = 0):
+        generator = torch.Generator().manual_seed(seed)
+        self.dim = dim
+        self.device = torch.device("cpu")
+        self.token_embeddings = torch.randn(vocab_size, dim, generator=generator)
+        self.image_projection = torch.randn(16 * 16, dim, generator=generator)
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        mask = attention_mask.unsqueeze(-1).float()
+        summed = (self.token_embeddings[input_ids] * mask).sum(dim=1)
+        return summed / mask.sum(dim=1).clamp(min=1)
+
+    def encode(self, images: Union[Image.Image, List[Image.Image]] = None) -> torch.Tensor:
+        if not isinstance(images, list):
+            images = [images]
+        pixels = torch.stack([
+            torch.tensor(list(image.convert("L").resize((16, 16)).tobytes()), dtype=torch.float32)
+            for image in images
+        ])
+        # Center the pixels so that the projection of a blank image is not degenerate
+        return (pixels / 255.0 - 0.5) @ self.image_projection + 1e-6
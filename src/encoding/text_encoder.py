@@ -1,32 +1,108 @@
 # src/encoding/text_encoder.py
+import time
 import torch
+from typing import List, Optional, Sequence, Union
 
-def encode_text(model, tokenizer, text: str, max_token_length: int, stride: int):
-    tokens = tokenizer(text, return_tensors="pt", truncation=False, padding=False)
-    input_ids = tokens['input_ids'][0]
+from src import metrics
 
-    if len(input_ids) <= max_token_length:
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=max_token_length)
-        input_ids = inputs['input_ids'].to(model.device)
-        attention_mask = inputs['attention_mask'].to(model.device)
-        with torch.no_grad():
-            feat = model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
-            feat = feat / feat.norm(dim=-1, keepdim=True)
-        return feat.cpu()
-
-    segment_feats = []
-    for start in range(0, len(input_ids), stride):
-        end = start + max_token_length
-        chunk_ids = input_ids[start:end]
-        if len(chunk_ids) == 0:
-            continue
-        chunk_ids = chunk_ids.unsqueeze(0).to(model.device)
-        attention_mask = torch.ones_like(chunk_ids).to(model.device)
-        with torch.no_grad():
-            feat = model.get_text_features(input_ids=chunk_ids, attention_mask=attention_mask)
-            feat = feat / feat.norm(dim=-1, keepdim=True)
-            segment_feats.append(feat.cpu())
-
-    final_feat = torch.mean(torch.cat(segment_feats, dim=0), dim=0, keepdim=True)
+def encode_text(model, tokenizer, text: str, max_token_length: int, stride: int,
+                max_windows: Optional[int] = None):
+    """Encode a single text, averaging its sliding windows in one batched forward pass."""
+    with metrics.stage("tokenize"):
+        input_ids = tokenizer(text, truncation=False, padding=False)['input_ids']
+    windows = limit_windows(split_windows(list(input_ids), max_token_length, stride), max_windows)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    with metrics.stage("encode_text"):
+        segment_feats = _encode_window_batch(model, windows, pad_id)
+    if len(windows) == 1:
+        return segment_feats
+
+    final_feat = torch.mean(segment_feats, dim=0, keepdim=True)
     final_feat = final_feat / final_feat.norm(dim=-1, keepdim=True)
-    return final_feat
\ No newline at end of file
+    return final_feat
+
+def split_windows(input_ids: List[int], max_token_length: int, stride: int) -> List[List[int]]:
+    """Split a token sequence into the same sliding windows used by `encode_text`."""
+    if len(input_ids) <= max_token_length:
+        return [input_ids]
+    return [input_ids[start:start + max_token_length] for start in range(0, len(input_ids), stride)]
+
+def limit_windows(windows: List[List[int]], max_windows: Optional[int]) -> List[List[int]]:
+    """Keep at most `max_windows` windows, spread evenly over the text (first and last included)."""
+    if max_windows is None or len(windows) <= max_windows:
+        return windows
+    if max_windows <= 1:
+        return windows[:1]
+    step = (len(windows) - 1) / (max_windows - 1)
+    return [windows[round(i * step)] for i in range(max_windows)]
+
+def encode_texts(model, tokenizer, texts: List[str], max_token_length: int, stride: int, batch_size: int = 64,
+                 max_windows: Union[Optional[int], Sequence[Optional[int]]] = None,
+                 window_counts: Optional[List[int]] = None, encode_seconds: Optional[List[float]] = None):
+    """Encode many documents, packing their windows into length-sorted padded batches.
+
+    Every document is tokenized once and split into sliding windows. Windows of all
+    documents are sorted by length so that each batch needs little padding, encoded
+    with one forward pass per batch, and averaged back per document exactly as
+    `encode_text` does.
+
+    `max_windows` caps the windows encoded per document (see `limit_windows`), either
+    one cap for all documents or one per document. If `window_counts` is given, each
+    document's window count before the cap is appended. If `encode_seconds` is given,
+    the time spent tokenizing and encoding is appended (used to estimate the cost per window).
+    """
+    start_time = time.perf_counter()
+    with metrics.stage("tokenize"):
+        all_ids = tokenizer(list(texts), truncation=False, padding=False)['input_ids']
+
+    if max_windows is None or isinstance(max_windows, int):
+        max_windows = [max_windows] * len(all_ids)
+
+    windows = []
+    doc_index = []
+    for doc_id, input_ids in enumerate(all_ids):
+        doc_windows = split_windows(list(input_ids), max_token_length, stride)
+        if window_counts is not None:
+            window_counts.append(len(doc_windows))
+        for window in limit_windows(doc_windows, max_windows[doc_id]):
+            windows.append(window)
+            doc_index.append(doc_id)
+
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    window_feats = [None] * len(windows)
+    with metrics.stage("encode_text"):
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            feats = _encode_window_batch(model, [windows[i] for i in batch], pad_id)
+            for i, feat in zip(batch, feats):
+                window_feats[i] = feat
+
+    window_feats = torch.stack(window_feats)
+    doc_index = torch.tensor(doc_index, dtype=torch.long)
+    doc_feats = torch.zeros(len(all_ids), window_feats.shape[-1], dtype=window_feats.dtype)
+    doc_feats.index_add_(0, doc_index, window_feats)
+    counts = torch.bincount(doc_index, minlength=len(all_ids)).clamp(min=1).unsqueeze(-1)
+    doc_feats = doc_feats / counts
+    if encode_seconds is not None:
+        encode_seconds.append(time.perf_counter() - start_time)
+    return doc_feats / doc_feats.norm(dim=-1, keepdim=True)
+
+def _encode_window_batch(model, windows: List[List[int]], pad_id: int):
+    """Run one forward pass over right-padded windows and return normalized features."""
+    max_len = max(len(window) for window in windows)
+    input_ids = torch.full((len(windows), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(windows), max_len), dtype=torch.long)
+    for row, window in enumerate(windows):
+        input_ids[row, :len(window)] = torch.as_tensor(window, dtype=torch.long)
+        attention_mask[row, :len(window)] = 1
+
+    with torch.no_grad():
+        feats = model.get_text_features(
+            input_ids=input_ids.to(model.device),
+            attention_mask=attention_mask.to(model.device)
+        )
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+    return feats.cpu()
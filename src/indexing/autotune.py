@@ -0,0 +1,213 @@
+# src/indexing/autotune.py
+import logging
+import math
+import re
+import time
+import faiss
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import yaml
+
+from .faiss_flat import FaissFlatIP
+from .sharded import SHARD_INDEXERS
+
+logger = logging.getLogger(__name__)
+
+# Corpus sizes from which the approximate backends are worth sweeping; below them
+# exact search is fast enough that graph or cluster structures only add build time
+HNSW_MIN_VECTORS = 10000
+IVF_MIN_VECTORS = 50000
+IVF_PQ_MIN_VECTORS = 1000000
+
+
+def _ivf_nlists(num_vectors: int) -> List[int]:
+    """nlist candidates around sqrt(N), capped so k-means keeps ~39 points per centroid."""
+    base = 2 ** max(4, round(math.log2(math.sqrt(num_vectors))))
+    cap = max(1, num_vectors // 39)
+    return sorted({min(nlist, cap) for nlist in (base, base * 4)})
+
+
+def candidate_grid(num_vectors: int, dim: int) -> Dict[str, List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]]:
+    """Parameters to try per indexer, scaled to the corpus size.
+
+    Each entry is (build params, [search params, ...]); an index is built once per
+    build setting and searched with every search setting.
+    """
+    grid = {
+        "faiss_flat": [({}, [{}])],
+        "faiss_lsh": [({"nbits": nbits}, [{}]) for nbits in (dim // 2, dim, dim * 2, dim * 4)],
+    }
+    if num_vectors >= HNSW_MIN_VECTORS:
+        grid["faiss_hnsw"] = [
+            ({"M": M, "efConstruction": 200}, [{"efSearch": ef} for ef in (16, 32, 64, 128, 256)])
+            for M in (16, 32)
+        ]
+    if num_vectors >= IVF_MIN_VECTORS:
+        encodings = [{"encoding": "flat"}]
+        if num_vectors >= IVF_PQ_MIN_VECTORS and dim % 8 == 0:
+            encodings.append({"encoding": "pq", "pq_m": dim // 8, "pq_nbits": 8})
+        grid["faiss_ivf"] = [
+            (dict(encoding, nlist=nlist), [{"nprobe": p} for p in (1, 2, 4, 8, 16, 32, 64, 128) if p <= nlist])
+            for nlist in _ivf_nlists(num_vectors)
+            for encoding in encodings
+        ]
+    return grid
+
+
+def exact_neighbors(features: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ids of the exact top-k of each query (ground truth)."""
+    indexer = FaissFlatIP({"dim": features.shape[1], "use_gpu": False})
+    _, ids = indexer.create_index(features).search(queries, k)
+    return ids
+
+
+def recall_at(found: np.ndarray, truth: np.ndarray) -> float:
+    """Share of the true top-k found among each query's candidates.
+
+    With re-ranking enabled the candidates are the top_k * factor the index returns,
+    since the exact re-ranker then restores the order within them.
+    """
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def index_bytes(index) -> int:
+    """Size of the serialized index, a close estimate of its memory footprint."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+class Corpus:
+    """A feature matrix with held-out queries and their exact top-k."""
+
+    def __init__(self, name: str, features: np.ndarray, queries: np.ndarray, k: int):
+        self.name = name
+        self.features = np.ascontiguousarray(features, dtype=np.float32)
+        self.queries = np.ascontiguousarray(queries, dtype=np.float32)
+        self.truth = exact_neighbors(self.features, self.queries, k)
+
+
+def hold_out(features, num_queries: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Split `num_queries` random rows off a feature matrix: (corpus, queries)."""
+    features = np.asarray(features, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    num_queries = min(num_queries, len(features) // 10)
+    if num_queries == 0:
+        raise ValueError(f"Too few vectors ({len(features)}) to hold out queries")
+    rows = rng.choice(len(features), size=num_queries, replace=False)
+    mask = np.ones(len(features), dtype=bool)
+    mask[rows] = False
+    return features[mask], features[rows]
+
+
+def _time_search(index, queries: np.ndarray, fetch: int, batch_size: int) -> Tuple[np.ndarray, float, List[float]]:
+    index.search(queries[:batch_size], fetch)  # warm-up
+    ids, latencies = [], []
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        batch_start = time.perf_counter()
+        _, batch_ids = index.search(queries[offset:offset + batch_size], fetch)
+        latencies.append(time.perf_counter() - batch_start)
+        ids.append(batch_ids)
+    return np.concatenate(ids), time.perf_counter() - start, latencies
+
+
+def sweep(corpora: Sequence[Corpus], k: int, fetch: int, grid: Optional[Dict[str, Any]] = None,
+          batch_size: int = 1, base_params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Measure recall@k, QPS, memory and build time of every candidate configuration.
+
+    One configuration serves all corpora (the pipeline uses a single indexer config for
+    the image and the text index): recall is the worst over corpora, QPS counts all
+    queries over the total search time, memory and build time are summed.
+    """
+    dim = corpora[0].features.shape[1]
+    if grid is None:
+        grid = candidate_grid(max(len(corpus.features) for corpus in corpora), dim)
+    base_params = dict(base_params or {}, dim=dim, use_gpu=False)
+
+    results = []
+    for name, builds in grid.items():
+        indexer_class = SHARD_INDEXERS[name]
+        for build_params, search_settings in builds:
+            built = []
+            build_seconds, memory = 0.0, 0
+            for corpus in corpora:
+                indexer = indexer_class(dict(base_params, **build_params))
+                start = time.perf_counter()
+                index = indexer.create_index(corpus.features)
+                build_seconds += time.perf_counter() - start
+                memory += index_bytes(index.index)
+                built.append(index)
+
+            for search_params in search_settings:
+                params = dict(build_params, **search_params)
+                indexer = indexer_class(dict(base_params, **params))
+                recalls, seconds, latencies, queries = [], 0.0, [], 0
+                for corpus, index in zip(corpora, built):
+                    indexer._configure(index.index)
+                    ids, elapsed, batch_latencies = _time_search(index, corpus.queries, min(fetch, index.ntotal), batch_size)
+                    recalls.append(recall_at(ids, corpus.truth))
+                    seconds += elapsed
+                    latencies.extend(batch_latencies)
+                    queries += len(corpus.queries)
+                result = {
+                    "indexer": name,
+                    "params": params,
+                    "recall": min(recalls),
+                    "qps": queries / seconds,
+                    "p50_ms": float(np.percentile(latencies, 50) * 1000.0),
+                    "p99_ms": float(np.percentile(latencies, 99) * 1000.0),
+                    "memory_bytes": memory,
+                    "build_seconds": build_seconds,
+                }
+                results.append(result)
+                logger.info("%s %s: recall@%d %.4f, %.0f QPS, %.1f MB", name, params, k,
+                            result["recall"], result["qps"], memory / 2 ** 20)
+    return results
+
+
+def pareto_front(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Results not dominated in (recall higher, QPS higher, memory lower), by recall."""
+    def dominates(a, b):
+        better_or_equal = a["recall"] >= b["recall"] and a["qps"] >= b["qps"] and a["memory_bytes"] <= b["memory_bytes"]
+        strictly = a["recall"] > b["recall"] or a["qps"] > b["qps"] or a["memory_bytes"] < b["memory_bytes"]
+        return better_or_equal and strictly
+
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=lambda r: (-r["recall"], -r["qps"]))
+
+
+def choose(results: List[Dict[str, Any]], target_recall: float,
+           max_memory_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Fastest configuration reaching `target_recall` within the memory budget.
+
+    Falls back to the most accurate configuration within the budget (or overall) when
+    none reaches the target.
+    """
+    within = [r for r in results if max_memory_bytes is None or r["memory_bytes"] <= max_memory_bytes] or results
+    eligible = [r for r in within if r["recall"] >= target_recall]
+    if eligible:
+        return max(eligible, key=lambda r: (r["qps"], -r["memory_bytes"]))
+    logger.warning("No configuration reaches recall %.3f, choosing the most accurate one", target_recall)
+    return max(within, key=lambda r: (r["recall"], r["qps"]))
+
+
+def indexer_config(result: Dict[str, Any], base_params: Dict[str, Any]) -> Dict[str, Any]:
+    """The `indexer` config block for a chosen result, keeping e.g. dim and use_gpu."""
+    params = {key: value for key, value in base_params.items() if key in ("dim", "use_gpu")}
+    params.update(result["params"])
+    return {"type": result["indexer"], "params": params}
+
+
+def replace_indexer_block(config_text: str, config: Dict[str, Any]) -> str:
+    """Replace the top-level `indexer:` block of a YAML config, keeping the rest of the file
+    (comments included) untouched."""
+    block = yaml.safe_dump({"indexer": config}, sort_keys=False, default_flow_style=False)
+    pattern = re.compile(r"^indexer:.*?(?=^\S|\Z)", re.M | re.S)
+    match = pattern.search(config_text)
+    if match is None:
+        return config_text.rstrip("\n") + "\n\n" + block
+    # Keep the blank lines separating the block from the next key
+    old = match.group(0)
+    tail = old[len(old.rstrip()):]
+    return config_text[:match.start()] + block.rstrip("\n") + tail + config_text[match.end():]
@@ -0,0 +1,183 @@
+# src/indexing/base_indexer.py
+import logging
+import os
+import threading
+import faiss
+import torch
+import numpy as np
+from typing import Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 at a time while an index is built, so that memory-mapped
+# float16 / int8 features are never dequantized as a whole next to the index
+BUILD_CHUNK_ROWS = 65536
+# Rows sampled for training quantizers (k-means uses at most 256 points per centroid)
+TRAIN_POINTS_PER_CENTROID = 256
+
+
+class CosineIndex:
+    """Wraps a FAISS index so that `search` returns cosine similarities (higher is better)."""
+
+    def __init__(self, index, to_similarity: Callable[[np.ndarray], np.ndarray]):
+        self.index = index
+        self.to_similarity = to_similarity
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def search(self, queries: np.ndarray, k: int, params=None):
+        """Return (similarities, ids) for each query row; missing hits have id -1."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if params is None:
+            D, I = self.index.search(queries, k)
+        else:
+            D, I = self.index.search(queries, k, params=params)
+        return self.to_similarity(D), I
+
+
+class LazyIndex:
+    """Stands in for an index that is built or loaded on first use.
+
+    `build` returns the real index (e.g. a CosineIndex); attribute access such as
+    `search` or `ntotal` triggers it once, concurrent first users wait for the same build.
+    """
+
+    def __init__(self, build: Callable[[], Any], name: str = ""):
+        self._build = build
+        self._index = None
+        self._lock = threading.Lock()
+        self.name = name
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def load(self):
+        """Build or load the index if that has not happened yet, and return it."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    logger.info("Loading %s index on first use...", self.name)
+                    self._index = self._build()
+        return self._index
+
+    def close(self):
+        # An index that was never used has nothing to release
+        if self._index is not None and hasattr(self._index, "close"):
+            self._index.close()
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+class FaissIndexer:
+    """Base class for FAISS indexers over L2-normalized features.
+
+    Subclasses build the raw FAISS index in `_build` and, if the index does not
+    score by inner product, convert its distances in `to_similarity`.
+    """
+
+    index_type = None
+    supports_gpu = True
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.dim = config.get("dim", 512)
+        self.use_gpu = config.get("use_gpu", False)
+
+    def create_index(self, features) -> CosineIndex:
+        """Create a FAISS index from features.
+
+        `features` may be an array, a tensor or a memory-mapped `FeatureArray`; rows are
+        added in chunks of BUILD_CHUNK_ROWS, so only one chunk at a time is converted
+        to float32 on top of the index itself.
+        """
+        index = self._configure(self._build(features))
+        return self._wrap(self._maybe_to_gpu(index))
+
+    def _build(self, features):
+        raise NotImplementedError
+
+    def _add(self, index, features):
+        """Add all rows of `features` to a FAISS index, one float32 chunk at a time."""
+        for start in range(0, len(features), BUILD_CHUNK_ROWS):
+            index.add(self._as_float32(features[start:start + BUILD_CHUNK_ROWS]))
+
+    def _training_sample(self, features, num_rows: int) -> np.ndarray:
+        """float32 copy of at most `num_rows` randomly chosen rows, for training quantizers."""
+        if len(features) <= num_rows:
+            return self._as_float32(features[0:len(features)])
+        rows = np.sort(np.random.default_rng(1234).choice(len(features), size=num_rows, replace=False))
+        if isinstance(features, torch.Tensor):
+            return self._as_float32(features[torch.from_numpy(rows)])
+        return self._as_float32(features[rows])
+
+    def _configure(self, index):
+        """Apply search-time parameters to a built or loaded CPU index."""
+        return index
+
+    def to_similarity(self, distances: np.ndarray) -> np.ndarray:
+        return distances
+
+    def search_params(self, scale: float, k: int):
+        """FAISS search parameters with search effort scaled by `scale` (0, 1].
+
+        Used to trade recall for latency when a request runs short of time. Returns
+        None for indexes without a tunable search effort.
+        """
+        return None
+
+    def _fingerprint_params(self) -> Dict[str, Any]:
+        return {}
+
+    def config_fingerprint(self) -> Dict[str, Any]:
+        """Settings that must match for a persisted index to be reused."""
+        fingerprint = {"index_type": self.index_type, "dim": self.dim}
+        fingerprint.update(self._fingerprint_params())
+        return fingerprint
+
+    def save_index(self, index: CosineIndex, path: str):
+        """Serialize a built index to disk.
+
+        The file is written next to `path` and renamed over it, so processes still
+        mapping the old index are unaffected.
+        """
+        raw = index.index
+        if self._on_gpu():
+            raw = faiss.index_gpu_to_cpu(raw)
+        tmp_path = path + ".tmp"
+        faiss.write_index(raw, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load_index(self, path: str) -> CosineIndex:
+        """Load a serialized index, memory-mapping it read-only when faiss supports it.
+
+        Memory-mapped indexes are backed by the page cache, so worker processes on the
+        same host that load the same file share its pages.
+        """
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            index = faiss.read_index(path, flags)
+        except RuntimeError:
+            index = faiss.read_index(path)
+        return self._wrap(self._maybe_to_gpu(self._configure(index)))
+
+    def _wrap(self, index) -> CosineIndex:
+        return CosineIndex(index, self.to_similarity)
+
+    def _on_gpu(self) -> bool:
+        return self.use_gpu and self.supports_gpu and torch.cuda.is_available()
+
+    def _maybe_to_gpu(self, index):
+        if self._on_gpu():
+            res = faiss.StandardGpuResources()
+            index = faiss.index_cpu_to_gpu(res, 0, index)
+        return index
+
+    @staticmethod
+    def _as_float32(features) -> np.ndarray:
+        if isinstance(features, torch.Tensor):
+            features = features.detach().cpu().numpy()
+        return np.ascontiguousarray(features, dtype=np.float32)
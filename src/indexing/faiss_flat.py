@@ -0,0 +1,15 @@
+# src/indexing/faiss_flat.py
+import faiss
+import numpy as np
+
+from .base_indexer import FaissIndexer
+
+class FaissFlatIP(FaissIndexer):
+    """Exact inner-product search; on normalized features the scores are cosine similarities."""
+
+    index_type = "flat_ip"
+
+    def _build(self, features):
+        index = faiss.IndexFlatIP(self.dim)
+        self._add(index, features)
+        return index
@@ -0,0 +1,35 @@
+# src/indexing/faiss_hnsw.py
+import faiss
+import numpy as np
+from typing import Dict, Any
+
+from .base_indexer import FaissIndexer
+
+class FaissHNSW(FaissIndexer):
+    """HNSW graph index scored by inner product (CPU only)."""
+
+    index_type = "hnsw"
+    supports_gpu = False
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.M = config.get("M", 32)
+        self.ef_construction = config.get("efConstruction", 200)
+        self.ef_search = config.get("efSearch", 64)
+
+    def _build(self, features):
+        index = faiss.IndexHNSWFlat(self.dim, self.M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        self._add(index, features)
+        return index
+
+    def _configure(self, index):
+        index.hnsw.efSearch = self.ef_search
+        return index
+
+    def search_params(self, scale: float, k: int):
+        # efSearch below k cannot return k results
+        return faiss.SearchParametersHNSW(efSearch=max(k, int(self.ef_search * scale)))
+
+    def _fingerprint_params(self) -> Dict[str, Any]:
+        return {"M": self.M, "efConstruction": self.ef_construction}
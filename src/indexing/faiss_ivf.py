@@ -0,0 +1,55 @@
+# src/indexing/faiss_ivf.py
+import logging
+import faiss
+import numpy as np
+from typing import Dict, Any
+
+from .base_indexer import FaissIndexer, TRAIN_POINTS_PER_CENTROID
+
+logger = logging.getLogger(__name__)
+
+class FaissIVF(FaissIndexer):
+    """Inverted-file index (IVF-Flat or IVF-PQ) scored by inner product."""
+
+    index_type = "ivf"
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.nlist = config.get("nlist", 1024)
+        self.nprobe = config.get("nprobe", 16)
+        self.encoding = config.get("encoding", "flat")
+        # IVF-PQ only: number of sub-quantizers and bits per sub-quantizer code
+        self.pq_m = config.get("pq_m", 64)
+        self.pq_nbits = config.get("pq_nbits", 8)
+        if self.encoding not in ("flat", "pq"):
+            raise ValueError(f"Unsupported IVF encoding '{self.encoding}', expected 'flat' or 'pq'")
+
+    def _build(self, features):
+        # k-means needs enough points per centroid; shrink nlist for small corpora
+        nlist = max(1, min(self.nlist, len(features) // 39))
+        if nlist < self.nlist:
+            logger.warning("Reducing nlist from %d to %d for %d vectors", self.nlist, nlist, len(features))
+
+        quantizer = faiss.IndexFlatIP(self.dim)
+        if self.encoding == "pq":
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.pq_m, self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        # k-means would subsample to this many points anyway; sampling first keeps the
+        # float32 training set bounded instead of dequantizing the whole matrix
+        index.train(self._training_sample(features, nlist * TRAIN_POINTS_PER_CENTROID))
+        self._add(index, features)
+        return index
+
+    def _configure(self, index):
+        index.nprobe = self.nprobe
+        return index
+
+    def search_params(self, scale: float, k: int):
+        return faiss.SearchParametersIVF(nprobe=max(1, int(self.nprobe * scale)))
+
+    def _fingerprint_params(self) -> Dict[str, Any]:
+        fingerprint = {"nlist": self.nlist, "encoding": self.encoding}
+        if self.encoding == "pq":
+            fingerprint.update({"pq_m": self.pq_m, "pq_nbits": self.pq_nbits})
+        return fingerprint
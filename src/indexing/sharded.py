@@ -0,0 +1,251 @@
+# src/indexing/sharded.py
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+from .base_indexer import FaissIndexer
+from .faiss_flat import FaissFlatIP
+from .faiss_hnsw import FaissHNSW
+from .faiss_ivf import FaissIVF
+from .faiss_lsh import FaissLSH
+
+logger = logging.getLogger(__name__)
+
+# Indexers a shard can use (same names as the "indexer" component registry)
+SHARD_INDEXERS = {
+    "faiss_lsh": FaissLSH,
+    "faiss_flat": FaissFlatIP,
+    "faiss_ivf": FaissIVF,
+    "faiss_hnsw": FaissHNSW,
+}
+
+
+def _shard_worker(conn, indexer_class, indexer_config: Dict[str, Any], threads: int):
+    """Worker process owning one shard index; serves commands sent over `conn`."""
+    import faiss
+    faiss.omp_set_num_threads(threads)
+    indexer = indexer_class(indexer_config)
+    index = None
+    while True:
+        try:
+            command, *args = conn.recv()
+        except EOFError:
+            break
+        if command == "close":
+            break
+        try:
+            if command == "build":
+                index = indexer.create_index(args[0])
+                reply = index.ntotal
+            elif command == "load":
+                index = indexer.load_index(args[0])
+                reply = index.ntotal
+            elif command == "save":
+                indexer.save_index(index, args[0])
+                reply = None
+            elif command == "search":
+                queries, k, scale = args
+                params = indexer.search_params(scale, k) if scale is not None else None
+                reply = index.search(queries, k, params=params)
+            else:
+                raise ValueError(f"Unknown shard command '{command}'")
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class _ShardClient:
+    """Coordinator-side handle of one shard worker process."""
+
+    def __init__(self, context, indexer_class, indexer_config: Dict[str, Any], threads: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_shard_worker, args=(child_conn, indexer_class, indexer_config, threads), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+
+    def send(self, *message):
+        self.conn.send(message)
+
+    def recv(self):
+        status, reply = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Shard worker failed: {reply}")
+        return reply
+
+    def close(self):
+        try:
+            self.conn.send(("close",))
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ShardedIndex:
+    """Scatter-gather search over shard worker processes.
+
+    Each query batch is sent to every shard at once; the per-shard top-k lists are
+    merged into a global top-k by similarity and local ids are offset back to global
+    row ids. Behaves like `CosineIndex` for the pipeline.
+    """
+
+    def __init__(self, clients: List[_ShardClient], offsets: List[int], counts: List[int]):
+        self.clients = clients
+        self.offsets = offsets
+        self.counts = counts
+        atexit.register(self.close)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(self.counts)
+
+    def search(self, queries: np.ndarray, k: int, params=None):
+        """Return (similarities, ids) of the global top-k; `params` is a search-effort scale or None."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        # Lock shards in a fixed order and release each as soon as it has answered, so
+        # concurrent searches pipeline through the workers without interleaving replies
+        for client in self.clients:
+            client.lock.acquire()
+        try:
+            for client in self.clients:
+                client.send("search", queries, k, params)
+        except Exception:
+            for client in self.clients:
+                client.lock.release()
+            raise
+
+        parts_D, parts_I, error = [], [], None
+        for client, offset in zip(self.clients, self.offsets):
+            try:
+                D, I = client.recv()
+                parts_D.append(D)
+                parts_I.append(np.where(I >= 0, I + offset, -1))
+            except Exception as e:
+                error = error or e
+            finally:
+                client.lock.release()
+        if error is not None:
+            raise error
+        return self._merge(np.concatenate(parts_D, axis=1), np.concatenate(parts_I, axis=1), k)
+
+    @staticmethod
+    def _merge(D: np.ndarray, I: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.where(I >= 0, D, -np.inf)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        top_D = np.take_along_axis(D, order, axis=1)
+        top_I = np.take_along_axis(I, order, axis=1)
+        return top_D, top_I
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = []
+
+
+class ShardedIndexer(FaissIndexer):
+    """Partitions the corpus into N shards, each indexed and searched by its own worker process.
+
+    Shards are contiguous row ranges of the feature matrix, so a shard-local id plus the
+    shard offset is the global row id used for `text_ids` / `image_paths`. Shards are
+    built in parallel and persisted as one index file per shard next to a JSON manifest.
+    """
+
+    index_type = "sharded"
+    supports_gpu = False
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.num_shards = config.get("shards", 4)
+        shard_config = config.get("shard_indexer", {"type": "faiss_flat"})
+        if shard_config["type"] not in SHARD_INDEXERS:
+            raise ValueError(f"Unsupported shard indexer '{shard_config['type']}', expected one of {list(SHARD_INDEXERS)}")
+        self.shard_class = SHARD_INDEXERS[shard_config["type"]]
+        # Shards are searched on CPU by their worker processes
+        self.shard_params = dict(shard_config.get("params", {}), dim=self.dim, use_gpu=False)
+        self.shard_indexer = self.shard_class(self.shard_params)
+        self.threads_per_shard = config.get("threads_per_shard", max(1, (os.cpu_count() or 1) // self.num_shards))
+        # spawn: forking a process that already runs OpenMP/torch threads is unsafe
+        self._context = multiprocessing.get_context("spawn")
+
+    def create_index(self, features) -> ShardedIndex:
+        bounds = np.linspace(0, len(features), min(self.num_shards, max(1, len(features))) + 1).astype(int)
+        clients = self._start_workers(len(bounds) - 1)
+        for client, start, end in zip(clients, bounds[:-1], bounds[1:]):
+            # One shard at a time is converted to float32 and sent to its worker
+            client.send("build", self._as_float32(features[int(start):int(end)]))
+        counts = [client.recv() for client in clients]
+        return ShardedIndex(clients, [int(start) for start in bounds[:-1]], counts)
+
+    def save_index(self, index: ShardedIndex, path: str):
+        """Write each shard next to `path` and a manifest listing them at `path`.
+
+        Shard files are named after `path` plus a generation, so a rebuild never touches
+        the shards the current manifest lists: atomically replacing the manifest switches
+        to the new shards in one rename, after which the previous shards are removed.
+        """
+        generation = uuid.uuid4().hex[:12]
+        shard_names = [f"{os.path.basename(path)}.{generation}.shard{i}" for i in range(len(index.clients))]
+        directory = os.path.dirname(path)
+        for client, name in zip(index.clients, shard_names):
+            client.send("save", os.path.join(directory, name))
+        for client in index.clients:
+            client.recv()
+
+        previous = []
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    previous = json.load(f).get("shards", [])
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read previous shard manifest %s: %s", path, e)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"shards": shard_names, "offsets": index.offsets, "counts": index.counts}, f)
+        os.replace(tmp_path, path)
+
+        # Processes that still have the old shards loaded keep their open files
+        for name in previous:
+            if name not in shard_names:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def load_index(self, path: str) -> ShardedIndex:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        directory = os.path.dirname(path)
+        clients = self._start_workers(len(manifest["shards"]))
+        for client, name in zip(clients, manifest["shards"]):
+            client.send("load", os.path.join(directory, name))
+        counts = [client.recv() for client in clients]
+        if counts != manifest["counts"]:
+            for client in clients:
+                client.close()
+            raise ValueError(f"Shard sizes {counts} do not match manifest {manifest['counts']}")
+        return ShardedIndex(clients, manifest["offsets"], counts)
+
+    def search_params(self, scale: float, k: int) -> Optional[float]:
+        # Shard workers build the faiss parameters themselves; pass only the scale
+        return scale if self.shard_indexer.search_params(scale, k) is not None else None
+
+    def _fingerprint_params(self) -> Dict[str, Any]:
+        return {"shards": self.num_shards, "shard_indexer": self.shard_indexer.config_fingerprint()}
+
+    def _start_workers(self, count: int) -> List[_ShardClient]:
+        logger.info("Starting %d shard workers (%s, %d threads each)", count, self.shard_class.__name__, self.threads_per_shard)
+        return [
+            _ShardClient(self._context, self.shard_class, self.shard_params, self.threads_per_shard)
+            for _ in range(count)
+        ]
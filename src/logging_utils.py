@@ -0,0 +1,104 @@
+# src/logging_utils.py
+import contextvars
+import json
+import logging
+import logging.config
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+import yaml
+
+DEFAULT_LOGGING_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "logging_config.yaml")
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None):
+    """Bind a request id to the log records emitted in this context.
+
+    Without an explicit id an already bound one is kept (nested pipelines share the
+    id of the outer request); otherwise a new id is generated.
+    """
+    if request_id is None and _request_id.get() is not None:
+        yield _request_id.get()
+        return
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+def bind_request_id(fn, request_id: Optional[str]):
+    """Wrap `fn` so that it runs with `request_id` bound, e.g. when submitted to a thread pool."""
+    def wrapper(*args, **kwargs):
+        with request_context(request_id):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` to every record passing a handler, unless given with `extra=`.
+
+    Uses the id bound by `request_context`, or "-" outside a request.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "request_id", None):
+            record.request_id = _request_id.get() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, request id, message and `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None) or _request_id.get(),
+            "message": record.getMessage(),
+        }
+        payload.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(config_path: Optional[str] = None, level: Optional[str] = None):
+    """Configure logging from a `logging.config.dictConfig` YAML file.
+
+    `level` (or the MMR_LOG_LEVEL environment variable) overrides the root level,
+    e.g. DEBUG to see the per-query messages of the hot path.
+    """
+    config_path = config_path or DEFAULT_LOGGING_CONFIG
+    level = level or os.environ.get("MMR_LOG_LEVEL")
+    config = None
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f)
+    if config:
+        if level:
+            config.setdefault("root", {})["level"] = level.upper()
+        logging.config.dictConfig(config)
+    else:
+        handler = logging.StreamHandler()
+        handler.addFilter(RequestIdFilter())
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s"))
+        logging.basicConfig(level=(level or "INFO").upper(), handlers=[handler])
@@ -0,0 +1,247 @@
+# src/metrics.py
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond index searches to multi-second LLM generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key: Tuple[str, ...], value) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_series(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Observations bucketed by upper bound, with their sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block, also when it raises."""
+        if not self.registry.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        """Sum and count of the observations of one label set."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {"sum": state[1], "count": state[2]} if state else {"sum": 0.0, "count": 0}
+
+    def _render_series(self, key, value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics of this process, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "mmr_stage_seconds", "Time spent in each processing stage",
+    ["stage"]
+)
+REQUESTS = REGISTRY.counter(
+    "mmr_requests_total", "Pipeline requests by pipeline and query type",
+    ["pipeline", "query_type"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "mmr_request_seconds", "Latency of pipeline requests, from submission to result",
+    ["pipeline", "query_type"]
+)
+ERRORS = REGISTRY.counter(
+    "mmr_errors_total", "Failures by stage",
+    ["stage"]
+)
+ANALYSIS_RETRIES = REGISTRY.counter(
+    "mmr_analysis_retries_total", "Query analyses regenerated after an invalid response"
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "mmr_cache_lookups_total", "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"]
+)
+DEGRADATIONS = REGISTRY.counter(
+    "mmr_degradations_total", "Degradations applied to meet request deadlines",
+    ["stage", "action"]
+)
+
+
+def stage(name: str):
+    """Time a processing stage: `with metrics.stage("search"): ...`"""
+    return STAGE_SECONDS.time(stage=name)
+
+
+# Cleared while the scheduler re-runs the requests of a failed batch one by one: the
+# batch attempt has already counted and timed them
+_track_requests = contextvars.ContextVar("track_requests", default=True)
+
+
+@contextmanager
+def untracked_requests():
+    """Run pipeline requests without counting or timing them again."""
+    token = _track_requests.set(False)
+    try:
+        yield
+    finally:
+        _track_requests.reset(token)
+
+
+@contextmanager
+def track_requests(pipeline: str, inputs: Sequence[Dict[str, Any]], default_query_type: Optional[str] = None):
+    """Count REQUESTS and observe REQUEST_SECONDS once per request of a batch, also when it raises.
+
+    Each request is timed from its `submitted_at` (the `time.perf_counter()` value the
+    micro-batch scheduler stamps when queueing it), so queueing time is included, or
+    from the start of the block for requests that were not queued.
+    """
+    if not REGISTRY.enabled or not _track_requests.get():
+        yield
+        return
+    query_types = [input_data.get("query_type", default_query_type) for input_data in inputs]
+    for query_type in query_types:
+        REQUESTS.inc(pipeline=pipeline, query_type=query_type)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        for input_data, query_type in zip(inputs, query_types):
+            REQUEST_SECONDS.observe(end - input_data.get("submitted_at", start), pipeline=pipeline, query_type=query_type)
+
+
+def configure(config: Optional[Dict[str, Any]]):
+    """Apply the `metrics` config block; disabled metrics skip all timing and counting."""
+    REGISTRY.enabled = (config or {}).get("enabled", True)
+
+
+def render() -> str:
+    return REGISTRY.render()
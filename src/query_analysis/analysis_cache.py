@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from PIL import Image
+
+from src.encoding.embedding_cache import image_digest, normalize_text
+
+
+class AnalysisCache:
+    """基于 SQLite 的查询分析结果持久化缓存（支持 TTL 与 LRU 淘汰）
+
+    只应缓存成功的分析结果；键由图像内容哈希、查询文本以及分析器的提示词/模型版本组成。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.path = config.get("path", "data/cache/query_analysis.sqlite")
+        self.max_entries = config.get("max_entries", 100000)
+        self.ttl_seconds = config.get("ttl_seconds", 7 * 24 * 3600)
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_accessed ON analysis (accessed)")
+
+    @staticmethod
+    def make_key(image: Image.Image, query_text: str, version: str) -> str:
+        payload = json.dumps([image_digest(image), normalize_text(query_text), version])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl_seconds and row[1] + self.ttl_seconds < now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE analysis SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]):
+        now = time.time()
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            # 按最近访问时间淘汰超出容量的条目
+            self._conn.execute(
+                "DELETE FROM analysis WHERE key IN ("
+                "SELECT key FROM analysis ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
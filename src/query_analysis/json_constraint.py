@@ -0,0 +1,259 @@
+"""
+查询分析的 JSON 约束解码：按固定四键结构约束生成，并在顶层 JSON 对象闭合时立即停止
+"""
+
+from typing import Dict, List, Optional, Tuple, Type
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+WHITESPACE = " \t\n\r"
+ESCAPABLE = '"\\/bfnrtu'
+
+# (类型, 参数)：lit 为固定字面量，str 为 JSON 字符串，arr 为字符串数组（参数为最少元素数）
+ANALYSIS_SCHEMA: List[Tuple[str, object]] = [
+    ("lit", "{"),
+    ("lit", '"original_query"'), ("lit", ":"), ("str", None), ("lit", ","),
+    ("lit", '"explicit_keywords"'), ("lit", ":"), ("arr", 0), ("lit", ","),
+    ("lit", '"implicit_keywords"'), ("lit", ":"), ("arr", 1), ("lit", ","),
+    ("lit", '"augmented_query"'), ("lit", ":"), ("str", None),
+    ("lit", "}"),
+]
+
+
+class BalancedJsonState:
+    """不做约束，仅跟踪花括号深度，用于在顶层 JSON 对象闭合时停止生成"""
+
+    __slots__ = ("depth", "in_string", "escape", "done")
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.done = False
+
+    def feed(self, text: str) -> bool:
+        for c in text:
+            if self.done:
+                break
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"' and self.depth > 0:
+                self.in_string = True
+            elif c == "{":
+                self.depth += 1
+            elif c == "}" and self.depth > 0:
+                self.depth -= 1
+                self.done = self.depth == 0
+        return True
+
+
+class JsonSchemaState:
+    """逐字符校验输出是否仍是 ANALYSIS_SCHEMA 的合法前缀"""
+
+    __slots__ = ("idx", "off", "phase", "escape", "items")
+
+    # 数组状态：0 等待 '['，1 刚读到 '['，2 元素字符串内部，3 元素之后，4 逗号之后
+    def __init__(self):
+        self.idx = 0
+        self.off = 0
+        self.phase = 0
+        self.escape = False
+        self.items = 0
+
+    @property
+    def done(self) -> bool:
+        return self.idx == len(ANALYSIS_SCHEMA)
+
+    def copy(self) -> "JsonSchemaState":
+        other = JsonSchemaState.__new__(JsonSchemaState)
+        other.idx, other.off, other.phase, other.escape, other.items = (
+            self.idx, self.off, self.phase, self.escape, self.items
+        )
+        return other
+
+    def feed(self, text: str) -> bool:
+        for c in text:
+            if not self._feed_char(c):
+                return False
+        return True
+
+    def next_char(self) -> str:
+        """一个必然合法的后续字符，在候选词元全部非法时用于兜底"""
+        kind, arg = ANALYSIS_SCHEMA[self.idx]
+        if kind == "lit":
+            return arg[self.off]
+        if kind == "str":
+            return '"'
+        if self.phase == 0:
+            return "["
+        if self.phase == 3:
+            return "]" if self.items >= arg else ","
+        return '"'
+
+    def _advance(self):
+        self.idx += 1
+        self.off = 0
+        self.phase = 0
+        self.items = 0
+
+    def _string_char(self, c: str) -> Optional[bool]:
+        """处理字符串内部字符；返回 None 表示字符串结束"""
+        if self.escape:
+            self.escape = False
+            return c in ESCAPABLE
+        if c == "\\":
+            self.escape = True
+            return True
+        if c == '"':
+            return None
+        return ord(c) >= 0x20
+
+    def _feed_char(self, c: str) -> bool:
+        if self.done:
+            return False
+        kind, arg = ANALYSIS_SCHEMA[self.idx]
+
+        if kind == "lit":
+            if self.off == 0 and c in WHITESPACE:
+                return True
+            if c != arg[self.off]:
+                return False
+            self.off += 1
+            if self.off == len(arg):
+                self._advance()
+            return True
+
+        if kind == "str":
+            if self.phase == 0:
+                if c in WHITESPACE:
+                    return True
+                if c == '"':
+                    self.phase = 1
+                    return True
+                return False
+            accepted = self._string_char(c)
+            if accepted is None:
+                self._advance()
+                return True
+            return accepted
+
+        # kind == "arr"
+        if self.phase == 2:
+            accepted = self._string_char(c)
+            if accepted is None:
+                self.items += 1
+                self.phase = 3
+                return True
+            return accepted
+        if c in WHITESPACE:
+            return True
+        if self.phase == 0:
+            if c == "[":
+                self.phase = 1
+                return True
+            return False
+        if c == '"' and self.phase in (1, 4):
+            self.phase = 2
+            return True
+        if c == "]" and self.items >= arg and self.phase in (1, 3):
+            self._advance()
+            return True
+        if c == "," and self.phase == 3:
+            self.phase = 4
+            return True
+        return False
+
+
+class JsonDecodingTracker:
+    """为批量生成中的每一行维护解析状态，并缓存词元文本"""
+
+    def __init__(self, tokenizer, state_class: Type, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.state_class = state_class
+        self.prompt_length = prompt_length
+        self.states: Optional[List] = None
+        self._consumed = prompt_length
+        self._token_text: Dict[int, str] = {}
+
+    def token_text(self, token_id: int) -> str:
+        text = self._token_text.get(token_id)
+        if text is None:
+            text = self.tokenizer.decode([token_id], skip_special_tokens=True)
+            self._token_text[token_id] = text
+        return text
+
+    def sync(self, input_ids: torch.LongTensor) -> List:
+        """把新生成的词元送入各行状态"""
+        if self.states is None:
+            self.states = [self.state_class() for _ in range(input_ids.shape[0])]
+        new_tokens = input_ids[:, self._consumed:].tolist()
+        for state, tokens in zip(self.states, new_tokens):
+            for token_id in tokens:
+                if state.done:
+                    break
+                state.feed(self.token_text(token_id))
+        self._consumed = input_ids.shape[1]
+        return self.states
+
+
+class SchemaConstrainedLogitsProcessor(LogitsProcessor):
+    """只保留使输出仍为合法 schema 前缀的候选词元
+
+    为控制开销，每步只检查得分最高的 top_n 个候选；全部非法时强制输出 next_char。
+    """
+
+    def __init__(self, tracker: JsonDecodingTracker, top_n: int = 32):
+        self.tracker = tracker
+        self.top_n = top_n
+        tokenizer = tracker.tokenizer
+        self.eos_token_ids = set()
+        for token_id in [tokenizer.eos_token_id, tokenizer.pad_token_id]:
+            if token_id is not None:
+                self.eos_token_ids.add(token_id)
+        self._char_tokens: Dict[str, int] = {}
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        states = self.tracker.sync(input_ids)
+        mask = torch.full_like(scores, float("-inf"))
+        top_n = min(self.top_n, scores.shape[-1])
+        candidates = scores.topk(top_n, dim=-1).indices.tolist()
+
+        for row, state in enumerate(states):
+            if state.done:
+                allowed = list(self.eos_token_ids)
+            else:
+                allowed = []
+                for token_id in candidates[row]:
+                    if token_id in self.eos_token_ids:
+                        continue
+                    text = self.tracker.token_text(token_id)
+                    if text and state.copy().feed(text):
+                        allowed.append(token_id)
+                if not allowed:
+                    allowed = [self._char_token(state.next_char())]
+            mask[row, allowed] = 0
+        return scores + mask
+
+    def _char_token(self, char: str) -> int:
+        token_id = self._char_tokens.get(char)
+        if token_id is None:
+            token_id = self.tracker.tokenizer.encode(char, add_special_tokens=False)[0]
+            self._char_tokens[char] = token_id
+        return token_id
+
+
+class JsonObjectStoppingCriteria(StoppingCriteria):
+    """顶层 JSON 对象闭合后停止对应行的生成"""
+
+    def __init__(self, tracker: JsonDecodingTracker):
+        self.tracker = tracker
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        states = self.tracker.sync(input_ids)
+        return torch.tensor([state.done for state in states], dtype=torch.bool, device=input_ids.device)
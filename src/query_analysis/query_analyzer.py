@@ -1,11 +1,18 @@
 import torch
 import json
+import hashlib
+import logging
 import re
 import os
+import time
 import traceback
 from typing import Dict, Any, List, Optional, Tuple
 from PIL import Image
-from transformers import AutoProcessor, MllamaForConditionalGeneration
+
+from src.deadline import Deadline
+from src import metrics
+
+logger = logging.getLogger(__name__)
 
 class QueryAnalyzer:
     """处理图文共查模式下的查询分析"""
@@ -16,12 +23,21 @@ class QueryAnalyzer:
         self.max_attempts = config.get("max_attempts", 3)
         self.temperature = config.get("temperature", 0.3)
         self.max_new_tokens = config.get("max_new_tokens", 1024)
+        self.batch_size = config.get("batch_size", 8)
+        # 约束解码：只允许生成符合四键 schema 的 JSON；stop_at_json_end 在顶层对象闭合时停止
+        self.constrained_decoding = config.get("constrained_decoding", True)
+        self.stop_at_json_end = config.get("stop_at_json_end", True)
+        self.constraint_top_n = config.get("constraint_top_n", 32)
+        # 有截止时间时为分析之后的增强检索预留的时间（毫秒），生成时长上限 = 剩余时间 - 预留
+        self.deadline_reserve_ms = config.get("deadline_reserve_ms", 200)
         self.device = config.get("device", "cuda" if torch.cuda.is_available() else "cpu")
         self._initialize_model()
         
     def _initialize_model(self):
         """初始化多模态大模型"""
-        print(f"正在加载查询分析模型: {self.model_path}")
+        logger.info("正在加载查询分析模型: %s", self.model_path)
+        # transformers 在加载模型时才导入，stub 分析器与只做检索的进程不需要它
+        from transformers import AutoProcessor, MllamaForConditionalGeneration
         try:
             self.model = MllamaForConditionalGeneration.from_pretrained(
                 self.model_path,
@@ -31,10 +47,9 @@ class QueryAnalyzer:
             
             self.processor = AutoProcessor.from_pretrained(self.model_path)
             self.processor.tokenizer.padding_side = 'left'
-            print("查询分析模型加载完成")
-        except Exception as e:
-            print(f"模型加载失败: {str(e)}")
-            traceback.print_exc()
+            logger.info("查询分析模型加载完成")
+        except Exception:
+            logger.exception("模型加载失败")
             raise
     
     def process_analysis(self, answer: str) -> str:
@@ -81,18 +96,9 @@ class QueryAnalyzer:
         except Exception as e:
             return f"PROCESSING_ERROR: {str(e)}"
 
-    def analyze_query(self, image: Image.Image, query_text: str) -> Dict[str, Any]:
-        """分析查询文本和相关图像，提取关键词和增强查询"""
-        attempt = 0
-        while attempt < self.max_attempts:
-            try:
-                # 准备提示词
-                image_path = getattr(image, 'filename', 'uploaded_image')
-                messages = {
-                    "role": "user",
-                    "content": [
-                        {"type": "image", "image": image},
-                        {"type": "text", "text": f"""You are a multimodal semantic parser. Analyze the user's query and associated image to generate structured retrieval keywords by following these steps:
+    def _build_prompt(self, image_path: str, query_text: str) -> str:
+        """构建查询分析提示词"""
+        return f"""You are a multimodal semantic parser. Analyze the user's query and associated image to generate structured retrieval keywords by following these steps:
 
                 1. Cross-Modal Entity Recognition:
                 - Identify explicit entities (nouns/verbs)
@@ -126,85 +132,213 @@ class QueryAnalyzer:
                 Image: {image_path}
                 Query: \"{query_text}\"
 
-                Generate valid JSON (IMPLICIT_KEYWORDS MUST BE NON-EMPTY ARRAY):""".replace("{", "{{").replace("}", "}}")}
-                    ]
-                }
-                input_text = self.processor.apply_chat_template([messages], add_generation_prompt=True)
-
-                # 处理输入并动态填充
-                inputs = self.processor(
-                    images=[[image]], 
-                    text=[input_text], 
-                    return_tensors="pt", 
-                    add_special_tokens=True, 
-                    padding="longest",  # 优化不同长度输入
-                    truncation=True,
-                    max_length=2048
-                ).to(self.model.device)
-
-                # 生成响应
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=self.max_new_tokens,
-                    temperature=self.temperature, 
-                )
-                
-                generated_response = self.processor.batch_decode(outputs, skip_special_tokens=True)[0]
-
-                # 增强响应处理
-                processed_json = self.process_analysis(generated_response)
-                parsed_json = json.loads(processed_json)
-
-                # 校验数据结构
-                required_keys = ["original_query", "explicit_keywords", "implicit_keywords", "augmented_query"]
-                for key in required_keys:
-                    if key not in parsed_json:
-                        raise KeyError(f"Missing required key: {key}")
-                    
-                if not isinstance(parsed_json["implicit_keywords"], list):
-                    raise TypeError(f"implicit_keywords must be list, got {type(parsed_json['implicit_keywords'])}")
-                    
-                if len(parsed_json["implicit_keywords"]) == 0:
-                    raise ValueError("implicit_keywords array is empty (minimum 1 item required)")
-
-                return {
-                    "success": True,
-                    "raw": generated_response,
-                    "processed": processed_json,
-                    "analysis": parsed_json
-                }
-
-            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:  
-                attempt += 1
-                error_detail = f"{type(e).__name__}: {str(e)}"
-                print(f"Attempt {attempt} failed for query '{query_text}' - {error_detail}")
-                
-                if attempt == self.max_attempts:
-                    return {
-                        "success": False,
-                        "raw": generated_response if 'generated_response' in locals() else None,
-                        "processed": processed_json if 'processed_json' in locals() else None,
-                        "error": f"Max attempts reached. Last error: {error_detail}",
+                Generate valid JSON (IMPLICIT_KEYWORDS MUST BE NON-EMPTY ARRAY):""".replace("{", "{{").replace("}", "}}")
+
+    def cache_version(self) -> str:
+        """提示词与模型版本标识，用于查询分析结果缓存的失效判断"""
+        payload = json.dumps([self.model_path, self._build_prompt("", ""), self.temperature, self.max_new_tokens])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _generate(self, images: List[Image.Image], query_texts: List[str],
+                  max_time: Optional[float] = None) -> List[Tuple[str, str]]:
+        """对一批图像/查询执行一次批量生成，返回 (完整解码文本, 新生成部分) 列表
+
+        max_time（秒）不为空时，生成超过该时长即被截断。
+        """
+        input_texts = []
+        for image, query_text in zip(images, query_texts):
+            # 准备提示词
+            image_path = getattr(image, 'filename', 'uploaded_image')
+            messages = {
+                "role": "user",
+                "content": [
+                    {"type": "image", "image": image},
+                    {"type": "text", "text": self._build_prompt(image_path, query_text)}
+                ]
+            }
+            input_texts.append(self.processor.apply_chat_template([messages], add_generation_prompt=True))
+
+        # 处理输入并动态填充（左侧填充，支持批量生成）
+        inputs = self.processor(
+            images=[[image] for image in images], 
+            text=input_texts, 
+            return_tensors="pt", 
+            add_special_tokens=True, 
+            padding="longest",  # 优化不同长度输入
+            truncation=True,
+            max_length=2048
+        ).to(self.model.device)
+
+        generate_kwargs = {}
+        prompt_length = inputs["input_ids"].shape[1]
+        if self.constrained_decoding or self.stop_at_json_end:
+            from transformers import LogitsProcessorList, StoppingCriteriaList
+            from .json_constraint import (
+                BalancedJsonState, JsonSchemaState, JsonDecodingTracker,
+                SchemaConstrainedLogitsProcessor, JsonObjectStoppingCriteria
+            )
+            state_class = JsonSchemaState if self.constrained_decoding else BalancedJsonState
+            tracker = JsonDecodingTracker(self.processor.tokenizer, state_class, prompt_length)
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([JsonObjectStoppingCriteria(tracker)])
+            if self.constrained_decoding:
+                generate_kwargs["logits_processor"] = LogitsProcessorList([
+                    SchemaConstrainedLogitsProcessor(tracker, self.constraint_top_n)
+                ])
+        if max_time is not None:
+            generate_kwargs["max_time"] = max_time
+
+        # 生成响应
+        outputs = self.model.generate(
+            **inputs,
+            max_new_tokens=self.max_new_tokens,
+            temperature=self.temperature, 
+            **generate_kwargs
+        )
+        
+        full_texts = self.processor.batch_decode(outputs, skip_special_tokens=True)
+        new_texts = self.processor.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+        return list(zip(full_texts, new_texts))
+
+    def _extract_json(self, generated_response: str, new_text: str) -> str:
+        """生成部分本身是合法 JSON（约束解码的情况）时直接使用，否则回退到正则修复"""
+        candidate = new_text.strip()
+        try:
+            json.loads(candidate)
+            return candidate
+        except ValueError:
+            return self.process_analysis(generated_response)
+
+    def _validate_analysis(self, processed_json: str) -> Dict[str, Any]:
+        """解析并校验分析结果的数据结构"""
+        parsed_json = json.loads(processed_json)
+
+        # 校验数据结构
+        required_keys = ["original_query", "explicit_keywords", "implicit_keywords", "augmented_query"]
+        for key in required_keys:
+            if key not in parsed_json:
+                raise KeyError(f"Missing required key: {key}")
+            
+        if not isinstance(parsed_json["implicit_keywords"], list):
+            raise TypeError(f"implicit_keywords must be list, got {type(parsed_json['implicit_keywords'])}")
+            
+        if len(parsed_json["implicit_keywords"]) == 0:
+            raise ValueError("implicit_keywords array is empty (minimum 1 item required)")
+
+        return parsed_json
+
+    def _generation_budget(self, deadline: Optional[Deadline]) -> Optional[float]:
+        """截止时间下本次生成可用的秒数；无截止时间时为 None"""
+        if deadline is None:
+            return None
+        return deadline.remaining() - self.deadline_reserve_ms / 1000.0
+
+    def analyze_queries(self, queries: List[Tuple[Image.Image, str]],
+                        deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """批量分析多个 (图像, 查询文本)，每轮只对失败的条目重新生成
+
+        给定 deadline 时，生成时长受剩余时间限制；时间不足时不再发起生成或重试，
+        并在 deadline 上记录所做的降级。
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        last_failure: Dict[int, Tuple[Optional[str], Optional[str], str]] = {}
+        pending = list(range(len(queries)))
+        attempt = 0
+
+        while pending and attempt < self.max_attempts:
+            attempt += 1
+            failed = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                max_time = self._generation_budget(deadline)
+                if max_time is not None and max_time <= 0:
+                    # 剩余时间不足，不再发起生成
+                    deadline.record("analysis", "skip_analysis" if attempt == 1 else "skip_retry", queries=len(chunk))
+                    for i in chunk:
+                        if i not in last_failure:
+                            results[i] = {"success": False, "error": "Deadline exceeded before query analysis."}
+                    failed.extend(i for i in chunk if i in last_failure)
+                    continue
+                if attempt > 1:
+                    metrics.ANALYSIS_RETRIES.inc(len(chunk))
+                try:
+                    generation_start = time.monotonic()
+                    with metrics.stage("generate"):
+                        responses = self._generate(
+                            [queries[i][0] for i in chunk],
+                            [queries[i][1] for i in chunk],
+                            max_time=max_time
+                        )
+                    if max_time is not None and time.monotonic() - generation_start >= max_time:
+                        deadline.record("analysis", "truncate_generation", max_time_ms=round(max_time * 1000, 1))
+                except Exception as e:
+                    logger.exception("查询分析生成失败")
+                    metrics.ERRORS.inc(len(chunk), stage="generate")
+                    for i in chunk:
+                        results[i] = {
+                            "success": False,
+                            "error": f"Critical error: {str(e)}",
+                            "traceback": traceback.format_exc()
+                        }
+                    continue
+
+                for i, (generated_response, new_text) in zip(chunk, responses):
+                    # 增强响应处理
+                    try:
+                        with metrics.stage("parse"):
+                            processed_json = self._extract_json(generated_response, new_text)
+                            parsed_json = self._validate_analysis(processed_json)
+                    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                        error_detail = f"{type(e).__name__}: {str(e)}"
+                        metrics.ERRORS.inc(stage="parse")
+                        logger.warning("Attempt %d failed for query '%s' - %s", attempt, queries[i][1], error_detail)
+                        last_failure[i] = (generated_response, processed_json, error_detail)
+                        failed.append(i)
+                        continue
+
+                    results[i] = {
+                        "success": True,
+                        "raw": generated_response,
+                        "processed": processed_json,
+                        "analysis": parsed_json
                     }
-                
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": f"Critical error: {str(e)}",
-                    "traceback": traceback.format_exc()
-                }
-                
-        return {"success": False, "error": "Failed to analyze query after multiple attempts."}
+            pending = failed
+            if deadline is not None and pending and attempt < self.max_attempts and self._generation_budget(deadline) <= 0:
+                # 剩余时间不足以重试，保留最后一次的失败信息
+                deadline.record("analysis", "skip_retry", queries=len(pending))
+                break
+
+        for i in pending:
+            if i not in last_failure:
+                results[i] = {"success": False, "error": "Failed to analyze query after multiple attempts."}
+                continue
+            generated_response, processed_json, error_detail = last_failure[i]
+            results[i] = {
+                "success": False,
+                "raw": generated_response,
+                "processed": processed_json,
+                "error": f"Max attempts reached. Last error: {error_detail}",
+            }
+        return results
+
+    def analyze_query(self, image: Image.Image, query_text: str,
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """分析查询文本和相关图像，提取关键词和增强查询"""
+        return self.analyze_queries([(image, query_text)], deadline)[0]
     
-    def get_enhanced_query(self, image: Image.Image, query_text: str) -> Tuple[str, Dict[str, Any]]:
+    def get_enhanced_queries(self, queries: List[Tuple[Image.Image, str]],
+                             deadline: Optional[Deadline] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """批量分析查询并返回增强的查询文本和分析结果"""
+        enhanced = []
+        for (_, query_text), result in zip(queries, self.analyze_queries(queries, deadline)):
+            if result["success"]:
+                enhanced.append((result["analysis"]["augmented_query"], result))
+            else:
+                # 如果分析失败，返回原始查询
+                logger.info("查询分析失败，使用原始查询: %s", result.get("error", "Unknown error"))
+                enhanced.append((query_text, result))
+        return enhanced
+
+    def get_enhanced_query(self, image: Image.Image, query_text: str,
+                           deadline: Optional[Deadline] = None) -> Tuple[str, Dict[str, Any]]:
         """分析查询并返回增强的查询文本和分析结果"""
-        result = self.analyze_query(image, query_text)
-        
-        if result["success"]:
-            analysis = result["analysis"]
-            enhanced_query = analysis["augmented_query"]
-            return enhanced_query, result
-        else:
-            # 如果分析失败，返回原始查询
-            print(f"查询分析失败，使用原始查询: {result.get('error', 'Unknown error')}")
-            return query_text, result
\ No newline at end of file
+        return self.get_enhanced_queries([(image, query_text)], deadline)[0]
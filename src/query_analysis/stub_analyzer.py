@@ -0,0 +1,40 @@
+import logging
+import json
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageStat
+
+from .query_analyzer import QueryAnalyzer
+
+logger = logging.getLogger(__name__)
+
+
+class StubQueryAnalyzer(QueryAnalyzer):
+    """不加载大模型的查询分析器，用于本地测试与基准测试
+
+    生成结果由查询文本和图像主色确定性地构造，走与真实模型相同的解析与校验流程。
+    在 query_analyzer 配置中设置 model_path: "stub" 即可启用。
+    """
+
+    COLOR_NAMES = ["red", "green", "blue"]
+
+    def _initialize_model(self):
+        logger.info("使用 stub 查询分析器（不加载模型）")
+        self.model = None
+        self.processor = None
+
+    def _generate(self, images: List[Image.Image], query_texts: List[str],
+                  max_time: Optional[float] = None) -> List[Tuple[str, str]]:
+        responses = []
+        for image, query_text in zip(images, query_texts):
+            means = ImageStat.Stat(image.convert("RGB")).mean
+            color = self.COLOR_NAMES[means.index(max(means))]
+            explicit = [word for word in query_text.split() if len(word) > 3][:3]
+            analysis = json.dumps({
+                "original_query": query_text,
+                "explicit_keywords": explicit,
+                "implicit_keywords": [color],
+                "augmented_query": f"{query_text} {color}".strip()
+            })
+            responses.append((f"assistant {analysis}", analysis))
+        return responses
@@ -0,0 +1,65 @@
+# src/retrieval/reranker.py
+import threading
+import numpy as np
+import torch
+from typing import Dict, Any, Tuple
+
+
+class ExactReranker:
+    """Second retrieval stage: re-scores ANN candidates by exact cosine similarity.
+
+    The index over-fetches `top_k * factor` candidates, which are re-ranked against
+    the stored float features so the final top-k has near-exact precision.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.enabled = config.get("enabled", True)
+        self.factor = config.get("factor", 4)
+        self.reranked_queries = 0
+        self.reordered_queries = 0
+        self._lock = threading.Lock()
+
+    def candidate_count(self, top_k: int, ntotal: int) -> int:
+        """Number of candidates to fetch from the first stage."""
+        return max(top_k, min(top_k * self.factor, ntotal))
+
+    def rerank(self, query_features: np.ndarray, candidate_ids: np.ndarray, features,
+               top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (similarities, ids) of the exact top-k among each query's candidates."""
+        query_features = np.asarray(query_features, dtype=np.float32)
+        valid = candidate_ids >= 0
+        rows = np.where(valid, candidate_ids, 0)
+
+        candidates = self._gather(features, rows.reshape(-1)).reshape(rows.shape + (-1,))
+        scores = np.einsum("qcd,qd->qc", candidates, query_features)
+        scores[~valid] = -np.inf
+
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        top_ids = np.take_along_axis(candidate_ids, order, axis=1)
+        # Keep the -1 convention for slots without a valid candidate
+        top_ids = np.where(np.isfinite(top_scores), top_ids, -1)
+
+        reordered = np.any(top_ids != candidate_ids[:, :top_k], axis=1)
+        with self._lock:
+            self.reranked_queries += len(top_ids)
+            self.reordered_queries += int(reordered.sum())
+        return top_scores.astype(np.float32), top_ids
+
+    def stats(self) -> Dict[str, Any]:
+        """How often the exact re-rank changed the first-stage top-k."""
+        with self._lock:
+            total = self.reranked_queries
+            reordered = self.reordered_queries
+        return {
+            "reranked_queries": total,
+            "reordered_queries": reordered,
+            "reorder_rate": reordered / total if total else 0.0
+        }
+
+    @staticmethod
+    def _gather(features, rows: np.ndarray) -> np.ndarray:
+        if isinstance(features, torch.Tensor):
+            return features[torch.from_numpy(rows)].numpy().astype(np.float32, copy=False)
+        return np.asarray(features[rows], dtype=np.float32)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# tune_index.py - 索引参数自动调优：在缓存的特征上扫描各索引参数，输出 recall/QPS/内存的 Pareto 表并写回索引配置
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import yaml
+
+from src.data_preprocessing.feature_store import FeatureArray
+from src.indexing.autotune import Corpus, hold_out, sweep, pareto_front, choose, indexer_config, replace_indexer_block
+from src.logging_utils import setup_logging
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多模态检索系统 - 索引参数自动调优")
+    parser.add_argument("--config", type=str, default="config/pipeline_config.yaml",
+                        help="检索管道配置文件路径（从 preprocessor.params.cache_dir 读取缓存的特征）")
+    parser.add_argument("--queries", type=int, default=500, help="每种模态留出的查询数量（不超过特征数的 10%%）")
+    parser.add_argument("--k", type=int, help="recall@k 的 k（默认使用 retriever.params.top_k）")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="目标 recall@k，选择达到目标的最快配置")
+    parser.add_argument("--max-memory-mb", type=float, help="索引内存上限（MB，图像与文本索引合计）")
+    parser.add_argument("--batch-size", type=int, default=1, help="每次检索的查询数量（1 表示逐条查询）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, help="完整测量结果的 JSON 输出路径")
+    parser.add_argument("--write", action="store_true", help="将选中的配置写回 --config 文件的 indexer 部分")
+    return parser.parse_args()
+
+def print_table(results, chosen, k):
+    print(f"\n{'':2}{'索引':<12}{'参数':<44}{f'recall@{k}':>10}{'QPS':>10}{'p99(ms)':>10}{'内存(MB)':>10}{'构建(s)':>9}")
+    for result in results:
+        marker = "* " if result is chosen else "  "
+        params = ", ".join(f"{key}={value}" for key, value in result["params"].items()) or "-"
+        print(f"{marker}{result['indexer']:<12}{params:<44}{result['recall']:>10.4f}{result['qps']:>10.0f}"
+              f"{result['p99_ms']:>10.3f}{result['memory_bytes'] / 2 ** 20:>10.1f}{result['build_seconds']:>9.2f}")
+
+def main():
+    args = parse_args()
+    setup_logging()
+
+    config_path = os.path.abspath(args.config)
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    cache_dir = config["preprocessor"]["params"].get("cache_dir", "cache")
+    feat_paths = {name: os.path.join(cache_dir, f"{name}_features.feat") for name in ("image", "text")}
+    missing = [path for path in feat_paths.values() if not os.path.exists(path)]
+    if missing:
+        print(f"未找到缓存的特征文件: {', '.join(missing)}，请先运行 run_pipeline.py 生成缓存")
+        sys.exit(1)
+
+    # 重排序开启时索引返回 top_k * factor 个候选，真实 top-k 只需出现在候选中
+    k = args.k or config.get("retriever", {}).get("params", {}).get("top_k", 5)
+    reranker = config.get("reranker", {}).get("params", {})
+    fetch = k * reranker.get("factor", 4) if "reranker" in config and reranker.get("enabled", True) else k
+
+    # 每种模态留出一部分向量作为查询；两个索引都用图像和文本查询检索（对应四种查询类型）
+    splits = {name: hold_out(FeatureArray(path), args.queries, args.seed) for name, path in feat_paths.items()}
+    queries = np.concatenate([held_out for _, held_out in splits.values()])
+    corpora = [Corpus(name, features, queries, k) for name, (features, _) in splits.items()]
+    print(f"图像向量 {len(corpora[0].features)} 个, 文本向量 {len(corpora[1].features)} 个, "
+          f"查询 {len(queries)} 条, recall@{k}（候选数 {fetch}）")
+
+    base_params = config.get("indexer", {}).get("params", {})
+    results = sweep(corpora, k, fetch, batch_size=args.batch_size, base_params=base_params)
+    max_memory = int(args.max_memory_mb * 2 ** 20) if args.max_memory_mb else None
+    chosen = choose(results, args.target_recall, max_memory)
+
+    print_table(pareto_front(results), chosen, k)
+    tuned = indexer_config(chosen, base_params)
+    print(f"\n选中的配置（目标 recall@{k} >= {args.target_recall}）:")
+    print(yaml.safe_dump({"indexer": tuned}, sort_keys=False, default_flow_style=False))
+
+    if args.report:
+        report = {
+            "k": k,
+            "fetch": fetch,
+            "target_recall": args.target_recall,
+            "vectors": {corpus.name: len(corpus.features) for corpus in corpora},
+            "queries": len(queries),
+            "chosen": tuned,
+            "results": results,
+            "pareto": pareto_front(results),
+        }
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"测量结果已保存到: {args.report}")
+
+    if args.write:
+        with open(config_path, "r") as f:
+            text = f.read()
+        with open(config_path, "w") as f:
+            f.write(replace_indexer_block(text, tuned))
+        print(f"已更新 {config_path} 中的 indexer 配置（重启管道后生效，索引会按新配置重建）")
+
+if __name__ == "__main__":
+    main()